@@ -0,0 +1,248 @@
+import heapq
+import math
+from Pathfinding import DIRECTIONS, DIAGONAL_COST
+from worldGenerator import CHUNK_SIZE
+
+# Straight entrances at least this long get a transition at each end instead of one in the middle
+LONG_ENTRANCE = 6
+
+# Offsets to the neighbouring clusters whose shared border or corner is scanned from this side;
+# the other four directions are looked up from the neighbour and flipped
+CANONICAL_OFFSETS = [(1, 0), (0, 1), (1, 1), (1, -1)]
+
+
+def octile_distance(x1, y1, x2, y2):
+    dx = abs(x1 - x2)
+    dy = abs(y1 - y2)
+    return dx + dy + (DIAGONAL_COST - 2) * min(dx, dy)
+
+
+class Cluster:
+    def __init__(self, bounds):
+        self.bounds = bounds  # (min_x, min_y, max_x, max_y), max exclusive
+        self.transitions = {}  # Entrance cell -> [(cell in a neighbouring cluster, cost)]
+        self.edges = {}  # Entrance cell -> [(entrance cell in this cluster, cost)], filled in on first use
+
+
+class HierarchicalPathfinder:
+    def __init__(self, grid, cluster_size=CHUNK_SIZE):
+        self.grid = grid  # WalkabilityGrid shared with the flat Pathfinder
+        self.width = grid.width
+        self.height = grid.height
+        self.cluster_size = cluster_size
+        self.clusters = {}  # (cluster_x, cluster_y) -> Cluster, built the first time a search needs it
+        self.expanded = 0  # Abstract nodes expanded by the last search
+
+    def cluster_key(self, x, y):
+        return x // self.cluster_size, y // self.cluster_size
+
+    def cluster_bounds(self, key):
+        size = self.cluster_size
+        min_x, min_y = key[0] * size, key[1] * size
+        return min_x, min_y, min(min_x + size, self.width), min(min_y + size, self.height)
+
+    def cluster_exists(self, key):
+        size = self.cluster_size
+        return 0 <= key[0] * size < self.width and 0 <= key[1] * size < self.height
+
+    def get_cluster(self, key):
+        cluster = self.clusters.get(key)
+        if cluster is None:
+            cluster = self.build_cluster(key)
+            self.clusters[key] = cluster
+        return cluster
+
+    def invalidate(self, x, y):
+        # A changed tile affects its own cluster and, on a cluster edge, the entrances of its neighbours
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                self.clusters.pop(self.cluster_key(x + dx, y + dy), None)
+
+    def build_cluster(self, key):
+        cluster = Cluster(self.cluster_bounds(key))
+        for ox, oy in CANONICAL_OFFSETS:
+            for offset, flip in (((ox, oy), False), ((-ox, -oy), True)):
+                neighbor = (key[0] + offset[0], key[1] + offset[1])
+                if not self.cluster_exists(neighbor):
+                    continue
+                if flip:
+                    pairs = [(b, a, cost) for a, b, cost in self.find_transitions(neighbor, (ox, oy))]
+                else:
+                    pairs = self.find_transitions(key, (ox, oy))
+                for cell, other, cost in pairs:
+                    cluster.transitions.setdefault(cell, []).append((other, cost))
+        return cluster
+
+    def find_transitions(self, key, offset):
+        # Crossings from cluster `key` into its neighbour at `offset`, as (cell in key, cell in neighbour, cost)
+        is_walkable = self.grid.is_walkable
+        min_x, min_y, max_x, max_y = self.cluster_bounds(key)
+        if offset == (1, 1):
+            a = (max_x - 1, max_y - 1)
+            b = (max_x, max_y)
+            if (is_walkable(*a) and is_walkable(*b) and
+                    not is_walkable(max_x, max_y - 1) and not is_walkable(max_x - 1, max_y)):
+                return [(a, b, DIAGONAL_COST)]
+            return []
+        if offset == (1, -1):
+            a = (max_x - 1, min_y)
+            b = (max_x, min_y - 1)
+            if (is_walkable(*a) and is_walkable(*b) and
+                    not is_walkable(max_x, min_y) and not is_walkable(max_x - 1, min_y - 1)):
+                return [(a, b, DIAGONAL_COST)]
+            return []
+
+        if offset == (1, 0):
+            a_cells = [(max_x - 1, y) for y in range(min_y, max_y)]
+            b_cells = [(max_x, y) for y in range(min_y, max_y)]
+        else:
+            a_cells = [(x, max_y - 1) for x in range(min_x, max_x)]
+            b_cells = [(x, max_y) for x in range(min_x, max_x)]
+        a_open = [is_walkable(*cell) for cell in a_cells]
+        b_open = [is_walkable(*cell) for cell in b_cells]
+
+        transitions = []
+        run_start = None
+        for i in range(len(a_cells) + 1):
+            if i < len(a_cells) and a_open[i] and b_open[i]:
+                if run_start is None:
+                    run_start = i
+                continue
+            if run_start is not None:
+                if i - run_start >= LONG_ENTRANCE:
+                    ends = [run_start, i - 1]
+                else:
+                    ends = [(run_start + i - 1) // 2]
+                for j in ends:
+                    transitions.append((a_cells[j], b_cells[j], 1.0))
+                run_start = None
+
+        # Diagonal steps across the border where neither straight crossing next to them is open
+        for i in range(len(a_cells) - 1):
+            if a_open[i] and b_open[i + 1] and not b_open[i] and not a_open[i + 1]:
+                transitions.append((a_cells[i], b_cells[i + 1], DIAGONAL_COST))
+            if a_open[i + 1] and b_open[i] and not a_open[i] and not b_open[i + 1]:
+                transitions.append((a_cells[i + 1], b_cells[i], DIAGONAL_COST))
+        return transitions
+
+    def search_cluster(self, start, bounds, goal=None):
+        # Dijkstra (or A* when a goal is given) restricted to one cluster; returns (costs, parents)
+        is_walkable = self.grid.is_walkable
+        min_x, min_y, max_x, max_y = bounds
+        costs = {start: 0.0}
+        parents = {start: None}
+        closed = set()
+        open_heap = [(0.0, 0.0, start)]
+        while open_heap:
+            _, cost, current = heapq.heappop(open_heap)
+            if current in closed:
+                continue
+            closed.add(current)
+            if current == goal:
+                break
+            x, y = current
+            for dx, dy, step in DIRECTIONS:
+                nx, ny = x + dx, y + dy
+                if not (min_x <= nx < max_x and min_y <= ny < max_y) or (nx, ny) in closed:
+                    continue
+                new_cost = cost + step
+                if new_cost < costs.get((nx, ny), math.inf) and is_walkable(nx, ny):
+                    costs[(nx, ny)] = new_cost
+                    parents[(nx, ny)] = current
+                    priority = new_cost + (octile_distance(nx, ny, goal[0], goal[1]) if goal else 0.0)
+                    heapq.heappush(open_heap, (priority, new_cost, (nx, ny)))
+        return costs, parents
+
+    def get_edges(self, cluster, cell):
+        edges = cluster.edges.get(cell)
+        if edges is None:
+            costs, _ = self.search_cluster(cell, cluster.bounds)
+            edges = [(other, costs[other]) for other in cluster.transitions
+                     if other != cell and other in costs]
+            cluster.edges[cell] = edges
+        return edges
+
+    def find_abstract_path(self, start, end):
+        # Waypoints from start to end; consecutive waypoints are adjacent or share a cluster
+        self.expanded = 0
+        if not self.grid.is_walkable(*start) or not self.grid.is_walkable(*end):
+            return None
+        if start == end:
+            return [start]
+
+        start_cluster = self.get_cluster(self.cluster_key(*start))
+        end_key = self.cluster_key(*end)
+        end_cluster = self.get_cluster(end_key)
+
+        # Link the end into its cluster's entrances (grid costs are symmetric)
+        end_costs, _ = self.search_cluster(end, end_cluster.bounds)
+        to_end = {cell: end_costs[cell] for cell in end_cluster.transitions if cell in end_costs}
+
+        start_costs, _ = self.search_cluster(start, start_cluster.bounds)
+        successors = [(cell, start_costs[cell]) for cell in start_cluster.transitions if cell in start_costs]
+        successors += start_cluster.transitions.get(start, [])
+        if end in start_costs:
+            successors.append((end, start_costs[end]))
+
+        g_costs = {start: 0.0}
+        parents = {start: None}
+        closed = set()
+        open_heap = [(octile_distance(*start, *end), start)]
+        while open_heap:
+            _, current = heapq.heappop(open_heap)
+            if current in closed:
+                continue
+            closed.add(current)
+            self.expanded += 1
+
+            if current == end:
+                path = []
+                while current is not None:
+                    path.append(current)
+                    current = parents[current]
+                return path[::-1]
+
+            if current != start:
+                key = self.cluster_key(*current)
+                cluster = self.get_cluster(key)
+                successors = self.get_edges(cluster, current) + cluster.transitions.get(current, [])
+                if key == end_key and current in to_end:
+                    successors = successors + [(end, to_end[current])]
+
+            current_g = g_costs[current]
+            for neighbor, cost in successors:
+                if neighbor in closed:
+                    continue
+                new_g_cost = current_g + cost
+                if new_g_cost < g_costs.get(neighbor, math.inf):
+                    g_costs[neighbor] = new_g_cost
+                    parents[neighbor] = current
+                    heapq.heappush(open_heap, (new_g_cost + octile_distance(*neighbor, *end), neighbor))
+
+        return None
+
+    def refine_segment(self, a, b):
+        # Tile path between two consecutive waypoints
+        if max(abs(a[0] - b[0]), abs(a[1] - b[1])) <= 1:
+            return [a, b]
+        _, parents = self.search_cluster(a, self.cluster_bounds(self.cluster_key(*a)), goal=b)
+        if b not in parents:
+            return None
+        path = []
+        current = b
+        while current is not None:
+            path.append(current)
+            current = parents[current]
+        return path[::-1]
+
+    def find_path(self, start, end):
+        waypoints = self.find_abstract_path(start, end)
+        if waypoints is None:
+            return None
+        path = [waypoints[0]]
+        for a, b in zip(waypoints, waypoints[1:]):
+            segment = self.refine_segment(a, b)
+            if segment is None:
+                return None
+            path.extend(segment[1:])
+        return path
@@ -0,0 +1,216 @@
+import heapq
+import math
+from Pathfinding import DIRECTIONS
+
+# Start the search over instead of repairing it once it holds this many cells
+MAX_STATES = 200000
+# Expansions one find_path may spend before giving up. Reachable targets within
+# HIERARCHICAL_DISTANCE took at most about 2800 on a 1000x1000 world; an unreachable one can
+# otherwise flood the whole region around the start.
+MAX_EXPANSIONS = 5000
+
+# Integer move costs keep every key exact. With float sums, keys that should tie can differ in the
+# last bit, the k2 tie-break flips and the search stops before repairing a cell the path relies on.
+STRAIGHT_COST = 10000
+DIAGONAL_COST = 14142
+
+
+class IncrementalPlanner:
+    # Moving Target D* Lite: a forward search rooted at the start that keeps its g/rhs values
+    # between calls. A moved goal only re-keys the open list, a start that moved along the search
+    # tree keeps the subtree below it, and changed tiles repair the cells around them.
+    def __init__(self, grid, max_expansions=MAX_EXPANSIONS):
+        self.grid = grid  # WalkabilityGrid
+        self.max_expansions = max_expansions
+        self.width = grid.width
+        self.height = grid.height
+        self.changed = set()  # Cells whose walkability changed since the last search
+        self.expanded = 0  # Nodes expanded by the last search
+        self.exhausted = False  # The last search ran out of expansions before it finished
+        self.reset()
+
+    def reset(self):
+        self.start = None
+        self.goal = None
+        self.g = {}  # Missing cells are math.inf
+        self.rhs = {}
+        self.parents = {}  # Cell -> predecessor that gives its rhs value
+        self.open_heap = []
+        self.open_keys = {}  # Cell -> key of its live heap entry; other entries are stale
+        self.km = 0
+
+    def tile_changed(self, x, y):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.changed.add(y * self.width + x)
+
+    def heuristic(self, a, b):
+        dx = abs(a % self.width - b % self.width)
+        dy = abs(a // self.width - b // self.width)
+        if dx < dy:
+            dx, dy = dy, dx
+        return STRAIGHT_COST * (dx - dy) + DIAGONAL_COST * dy
+
+    def neighbors(self, cell):
+        # All in-bounds neighbours with the cost of the move; blocked cells are included so that
+        # their values can be invalidated when they stop being walkable
+        width = self.width
+        x, y = cell % width, cell // width
+        result = []
+        for dx, dy, _ in DIRECTIONS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < self.height:
+                result.append((ny * width + nx, DIAGONAL_COST if dx and dy else STRAIGHT_COST))
+        return result
+
+    def is_walkable(self, cell):
+        return self.grid.is_walkable(cell % self.width, cell // self.width)
+
+    def calculate_key(self, cell):
+        value = min(self.g.get(cell, math.inf), self.rhs.get(cell, math.inf))
+        return value + self.heuristic(cell, self.goal) + self.km, value
+
+    def top_key(self):
+        while self.open_heap:
+            k1, k2, cell = self.open_heap[0]
+            if self.open_keys.get(cell) == (k1, k2):
+                return k1, k2
+            heapq.heappop(self.open_heap)
+        return math.inf, math.inf
+
+    def update_vertex(self, cell):
+        if cell != self.start:
+            best, parent = math.inf, None
+            if self.is_walkable(cell):
+                g = self.g
+                for neighbor, step in self.neighbors(cell):
+                    value = g.get(neighbor, math.inf) + step
+                    if value < best and self.is_walkable(neighbor):
+                        best, parent = value, neighbor
+            if parent is None:
+                self.rhs.pop(cell, None)
+                self.parents.pop(cell, None)
+            else:
+                self.rhs[cell] = best
+                self.parents[cell] = parent
+        self.open_keys.pop(cell, None)
+        if self.g.get(cell, math.inf) != self.rhs.get(cell, math.inf):
+            key = self.calculate_key(cell)
+            self.open_keys[cell] = key
+            heapq.heappush(self.open_heap, (key[0], key[1], cell))
+
+    def compute_shortest_path(self):
+        # False if it stopped after max_expansions without finishing
+        g = self.g
+        rhs = self.rhs
+        goal = self.goal
+        while (self.top_key() < self.calculate_key(goal) or
+               rhs.get(goal, math.inf) != g.get(goal, math.inf)):
+            if self.expanded >= self.max_expansions:
+                return False
+            k1, k2, cell = heapq.heappop(self.open_heap)
+            del self.open_keys[cell]
+
+            new_key = self.calculate_key(cell)
+            if (k1, k2) < new_key:
+                # Key was computed for an earlier goal; requeue it rather than expand it
+                self.open_keys[cell] = new_key
+                heapq.heappush(self.open_heap, (new_key[0], new_key[1], cell))
+                continue
+
+            self.expanded += 1
+            if g.get(cell, math.inf) > rhs.get(cell, math.inf):
+                g[cell] = rhs[cell]
+                for neighbor, _ in self.neighbors(cell):
+                    self.update_vertex(neighbor)
+            else:
+                g.pop(cell, None)
+                self.update_vertex(cell)
+                for neighbor, _ in self.neighbors(cell):
+                    self.update_vertex(neighbor)
+        return True
+
+    def move_start(self, new_start):
+        # Re-root the search at a cell of the old search tree. Cells below the new start keep their
+        # values (all offset by the same g(new_start)); every other cell is cleared and repaired.
+        value = self.g.get(new_start, math.inf)
+        if value == math.inf or self.rhs.get(new_start) != value:
+            return False
+
+        parents = self.parents
+        in_subtree = {new_start: True}
+        for cell in list(parents):
+            chain = []
+            current = cell
+            while current not in in_subtree and current is not None and len(chain) <= len(parents):
+                chain.append(current)
+                current = parents.get(current)
+            result = in_subtree.get(current, False)
+            for link in chain:
+                in_subtree[link] = result
+
+        deleted = [cell for cell in set(parents) | set(self.g) if not in_subtree.get(cell, False)]
+        self.start = new_start
+        parents.pop(new_start, None)
+        for cell in deleted:
+            self.g.pop(cell, None)
+            self.rhs.pop(cell, None)
+            parents.pop(cell, None)
+            self.open_keys.pop(cell, None)
+        for cell in deleted:
+            self.update_vertex(cell)
+        return True
+
+    def extract_path(self):
+        if self.g.get(self.goal, math.inf) == math.inf:
+            return None
+        path = [self.goal]
+        current = self.goal
+        while current != self.start:
+            current = self.parents.get(current)
+            if current is None or len(path) > len(self.g):
+                return None
+            path.append(current)
+        return [(cell % self.width, cell // self.width) for cell in reversed(path)]
+
+    def find_path(self, start, end):
+        self.expanded = 0
+        self.exhausted = False
+        if not self.grid.is_walkable(start[0], start[1]) or not self.grid.is_walkable(end[0], end[1]):
+            return None
+
+        start = start[1] * self.width + start[0]
+        goal = end[1] * self.width + end[0]
+        changed, self.changed = self.changed, set()
+        if self.start is None or len(self.g) > MAX_STATES or (changed & {start, self.start}):
+            restart = True
+        else:
+            # Apply tile changes before re-rooting so the search tree being walked is up to date
+            for cell in changed:
+                self.update_vertex(cell)
+                for neighbor, _ in self.neighbors(cell):
+                    self.update_vertex(neighbor)
+            if changed and not self.compute_shortest_path():
+                return self.give_up()
+            restart = start != self.start and not self.move_start(start)
+
+        if restart:
+            self.reset()
+            self.start = start
+            self.goal = goal
+            self.g[start] = self.rhs[start] = 0
+            for neighbor, _ in self.neighbors(start):
+                self.update_vertex(neighbor)
+        elif goal != self.goal:
+            # Keys already in the heap used the old goal; km keeps them lower bounds
+            self.km += self.heuristic(self.goal, goal)
+            self.goal = goal
+
+        if not self.compute_shortest_path():
+            return self.give_up()
+        return self.extract_path()
+
+    def give_up(self):
+        # The half-finished search is dropped so the next call starts small
+        self.exhausted = True
+        self.reset()
+        return None
@@ -0,0 +1,53 @@
+from collections import defaultdict
+
+INTEREST_RADIUS = 1200  # Pixels; players see everyone within this distance of themselves
+
+
+class InterestGrid:
+    # Uniform grid of world-pixel cells holding the players inside them. A radius query only looks
+    # at the cells overlapping the circle, so its cost follows local density rather than player count.
+    def __init__(self, cell_size=INTEREST_RADIUS):
+        self.cell_size = cell_size
+        self.cells = defaultdict(set)  # (cell_x, cell_y) -> player ids
+        self.positions = {}  # player id -> (x, y)
+        self.player_cells = {}  # player id -> (cell_x, cell_y)
+
+    def cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def update(self, player_id, x, y):
+        self.positions[player_id] = (x, y)
+        key = self.cell(x, y)
+        old = self.player_cells.get(player_id)
+        if old != key:
+            if old is not None:
+                self.discard_from(old, player_id)
+            self.cells[key].add(player_id)
+            self.player_cells[player_id] = key
+
+    def remove(self, player_id):
+        self.positions.pop(player_id, None)
+        key = self.player_cells.pop(player_id, None)
+        if key is not None:
+            self.discard_from(key, player_id)
+
+    def discard_from(self, key, player_id):
+        members = self.cells[key]
+        members.discard(player_id)
+        if not members:
+            del self.cells[key]
+
+    def query(self, x, y, radius):
+        # Ids of players within radius of (x, y)
+        min_x, min_y = self.cell(x - radius, y - radius)
+        max_x, max_y = self.cell(x + radius, y + radius)
+        radius_sq = radius * radius
+        positions = self.positions
+        result = set()
+        for cell_y in range(min_y, max_y + 1):
+            for cell_x in range(min_x, max_x + 1):
+                for player_id in self.cells.get((cell_x, cell_y), ()):
+                    px, py = positions[player_id]
+                    if (px - x) ** 2 + (py - y) ** 2 <= radius_sq:
+                        result.add(player_id)
+        return result
@@ -1,5 +1,17 @@
 import pygame
 import math
+import numpy as np
+from collections import OrderedDict
+from worldGenerator import MAX_CHUNKS, TILE_CASTS_SHADOW
+
+AMBIENT = (20, 20, 20)
+WALL_GRID_CELL = 64  # Pixel size of a WallGrid cell
+BATCH_PAIRS = 50000  # Above this many sample x wall tests, a light's samples are tested cell by cell
+SWEEP_EPSILON = 0.0001  # Radians either side of each endpoint, so rays slip past wall corners
+LIGHT_QUANTUM = 4  # Cached lights snap to this many pixels, so a light that barely moved reuses its lightmap
+MAX_CACHED_LIGHTS = 64
+
+falloff_masks = {}  # (radius, colour) -> Surface with the light's falloff, shared by every light like it
 
 
 class Light:
@@ -16,6 +28,99 @@ class Wall:
         self.x2, self.y2 = x2, y2
 
 
+def merge_runs(edges):
+    # (row, start, end) for every horizontal run of True in a 2D bool array, end exclusive
+    padded = np.zeros((edges.shape[0], edges.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = edges
+    change = np.diff(padded, axis=1)
+    start_rows, starts = np.nonzero(change == 1)
+    _, ends = np.nonzero(change == -1)
+    return start_rows, starts, ends
+
+
+class WallCache:
+    # Shadow-casting outlines per chunk, in world pixels. Only edges between a shadow-casting tile and
+    # one that is not are kept, and collinear edges are merged into one segment. Built when first
+    # needed and reused every frame until a tile in or next to the chunk changes.
+    def __init__(self, chunks, width, height, tile_size, max_chunks=MAX_CHUNKS):
+        self.chunks = chunks  # ChunkStore
+        self.width = width  # World size in tiles; tiles outside it cast no shadow
+        self.height = height
+        self.tile_size = tile_size
+        self.max_chunks = max_chunks
+        self.segments = OrderedDict()  # (chunk_x, chunk_y) -> float array of (x1, y1, x2, y2), least recently used first
+
+    def invalidate(self, x, y):
+        size = self.chunks.chunk_size
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                self.segments.pop(((x + dx) // size, (y + dy) // size), None)
+
+    def casts_shadow(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height and TILE_CASTS_SHADOW[self.chunks.get_tile(x, y)]
+
+    def build_chunk(self, chunk_x, chunk_y):
+        size = self.chunks.chunk_size
+        origin_x, origin_y = chunk_x * size, chunk_y * size
+        # Shadow casters in the chunk plus a one-tile border from its neighbours
+        blocked = np.zeros((size + 2, size + 2), dtype=bool)
+        tiles = np.frombuffer(self.chunks.get_chunk(chunk_x, chunk_y), dtype=np.uint8).reshape(size, size)
+        blocked[1:-1, 1:-1] = np.frombuffer(TILE_CASTS_SHADOW, dtype=np.uint8)[tiles].astype(bool)
+        for i in range(-1, size + 1):
+            blocked[0, i + 1] = self.casts_shadow(origin_x + i, origin_y - 1)
+            blocked[-1, i + 1] = self.casts_shadow(origin_x + i, origin_y + size)
+            blocked[i + 1, 0] = self.casts_shadow(origin_x - 1, origin_y + i)
+            blocked[i + 1, -1] = self.casts_shadow(origin_x + size, origin_y + i)
+        # Tiles past the edge of the world are never drawn, so they cast nothing either
+        inside_x = (np.arange(-1, size + 1) + origin_x < self.width)[None, :]
+        inside_y = (np.arange(-1, size + 1) + origin_y < self.height)[:, None]
+        blocked &= inside_x & inside_y
+
+        centre = blocked[1:-1, 1:-1]
+        segments = []
+        # Top and bottom edges run along rows, left and right edges along columns
+        for edges, offset in ((centre & ~blocked[:-2, 1:-1], 0), (centre & ~blocked[2:, 1:-1], 1)):
+            rows, starts, ends = merge_runs(edges)
+            y = origin_y + rows + offset
+            segments.append(np.column_stack([origin_x + starts, y, origin_x + ends, y]))
+        for edges, offset in ((centre & ~blocked[1:-1, :-2], 0), (centre & ~blocked[1:-1, 2:], 1)):
+            columns, starts, ends = merge_runs(edges.T)
+            x = origin_x + columns + offset
+            segments.append(np.column_stack([x, origin_y + starts, x, origin_y + ends]))
+        return np.vstack(segments).astype(np.float64) * self.tile_size
+
+    def get_chunk_segments(self, chunk_x, chunk_y):
+        key = (chunk_x, chunk_y)
+        segments = self.segments.get(key)
+        if segments is None:
+            segments = self.build_chunk(chunk_x, chunk_y)
+            self.segments[key] = segments
+            if len(self.segments) > self.max_chunks:
+                self.segments.popitem(last=False)
+        else:
+            self.segments.move_to_end(key)
+        return segments
+
+    def get_walls(self, start_x, start_y, end_x, end_y, camera_x, camera_y, lights=()):
+        # Segments touching the tile rectangle [start, end), translated to screen coordinates
+        size = self.chunks.chunk_size
+        tile = self.tile_size
+        chunk_segments = [self.get_chunk_segments(chunk_x, chunk_y)
+                          for chunk_y in range(start_y // size, (end_y - 1) // size + 1)
+                          for chunk_x in range(start_x // size, (end_x - 1) // size + 1)]
+        # A light standing on a shadow-casting tile is still boxed in by that tile's own edges
+        for light in lights:
+            x, y = int(light.x + camera_x) // tile, int(light.y + camera_y) // tile
+            if self.casts_shadow(x, y):
+                x, y = x * tile, y * tile
+                chunk_segments.append(np.array([(x, y, x + tile, y), (x + tile, y, x + tile, y + tile),
+                                                (x + tile, y + tile, x, y + tile), (x, y + tile, x, y)],
+                                               dtype=np.float64))
+        segments = np.vstack(chunk_segments) if chunk_segments else np.empty((0, 4))
+        segments = walls_in_rect(segments, start_x * tile, start_y * tile, end_x * tile, end_y * tile)
+        return segments - (camera_x, camera_y, camera_x, camera_y)
+
+
 def line_intersect(x1, y1, x2, y2, x3, y3, x4, y4):
     denom = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
     if abs(denom) < 0.001:
@@ -38,44 +143,345 @@ def is_in_shadow(light_x, light_y, px, py, walls):
     return False
 
 
-def render_lightmap(screen, lights, walls, step=12):
+def wall_array(walls):
+    if isinstance(walls, WallGrid):
+        return walls.segments
+    if isinstance(walls, np.ndarray):
+        return walls
+    return np.array([(w.x1, w.y1, w.x2, w.y2) for w in walls], dtype=np.float64).reshape(-1, 4)
+
+
+def walls_in_rect(segments, min_x, min_y, max_x, max_y):
+    # Segments whose bounding box overlaps the rectangle
+    return segments[
+        (np.maximum(segments[:, 0], segments[:, 2]) >= min_x) &
+        (np.minimum(segments[:, 0], segments[:, 2]) <= max_x) &
+        (np.maximum(segments[:, 1], segments[:, 3]) >= min_y) &
+        (np.minimum(segments[:, 1], segments[:, 3]) <= max_y)]
+
+
+class WallGrid:
+    # Uniform grid over wall segments. Each cell lists the segments whose bounding box overlaps it, so
+    # a query only looks at the cells it covers instead of the whole wall list.
+    def __init__(self, walls, cell_size=WALL_GRID_CELL):
+        self.segments = wall_array(walls)
+        self.cell_size = cell_size
+        self.cells = {}  # (cell_x, cell_y) -> array of indices into self.segments
+
+        segments = self.segments
+        low_x = np.floor(np.minimum(segments[:, 0], segments[:, 2]) / cell_size).astype(np.int64)
+        high_x = np.floor(np.maximum(segments[:, 0], segments[:, 2]) / cell_size).astype(np.int64)
+        low_y = np.floor(np.minimum(segments[:, 1], segments[:, 3]) / cell_size).astype(np.int64)
+        high_y = np.floor(np.maximum(segments[:, 1], segments[:, 3]) / cell_size).astype(np.int64)
+        # One (segment, cell) pair per cell each segment's bounding box covers
+        span_x = high_x - low_x + 1
+        counts = span_x * (high_y - low_y + 1)
+        index = np.repeat(np.arange(len(segments)), counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_x = low_x[index] + within % span_x[index]
+        cell_y = low_y[index] + within // span_x[index]
+
+        order = np.lexsort((cell_x, cell_y))
+        index, cell_x, cell_y = index[order], cell_x[order], cell_y[order]
+        first = np.ones(len(index), dtype=bool)
+        first[1:] = (cell_x[1:] != cell_x[:-1]) | (cell_y[1:] != cell_y[:-1])
+        starts = np.flatnonzero(first)
+        for start, end in zip(starts, np.append(starts[1:], len(index))):
+            self.cells[(int(cell_x[start]), int(cell_y[start]))] = index[start:end]
+
+    def query(self, min_x, min_y, max_x, max_y):
+        # Segments in the cells overlapping the rectangle (a superset of the segments inside it)
+        size = self.cell_size
+        found = [self.cells[key]
+                 for key in ((cell_x, cell_y)
+                             for cell_y in range(math.floor(min_y / size), math.floor(max_y / size) + 1)
+                             for cell_x in range(math.floor(min_x / size), math.floor(max_x / size) + 1))
+                 if key in self.cells]
+        if not found:
+            return self.segments[:0]
+        return self.segments[np.unique(np.concatenate(found))]
+
+
+def shadowed_samples(light, px, py, dist_sq, walls):
+    # Batched is_in_shadow: tests every sample ray against every wall at once, with the same
+    # arithmetic (and rounding) as line_intersect. Returns a bool per sample.
+    x1, y1 = light.x, light.y
+    x2, y2 = px[:, None], py[:, None]
+    x3, y3, x4, y4 = walls[:, 0], walls[:, 1], walls[:, 2], walls[:, 3]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
+        t = ((x1 - x3) * (y3 - y4) - (y1 - y3) * (x3 - x4)) / denom
+        u = -((x1 - x2) * (y1 - y3) - (y1 - y2) * (x1 - x3)) / denom
+        hit = (np.abs(denom) >= 0.001) & (t >= 0) & (u >= 0) & (u <= 1)
+        wx = x1 + t * (x2 - x1)
+        wy = y1 + t * (y2 - y1)
+        hit &= (wx - x1) ** 2 + (wy - y1) ** 2 < dist_sq[:, None]
+    return hit.any(axis=1)
+
+
+def shadowed_by_cell(light, px, py, dist_sq, grid):
+    # A ray only crosses the grid cells between the light and its sample, so the samples in each
+    # cell are tested against the walls of the rectangle spanning the light and that cell
+    # (with 1px slack for rounding). Cheaper than one batch when a light has many walls near it.
+    cell = grid.cell_size
+    cell_x, cell_y = np.floor(px / cell), np.floor(py / cell)
+    order = np.lexsort((cell_x, cell_y))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (cell_x[order[1:]] != cell_x[order[:-1]]) | (cell_y[order[1:]] != cell_y[order[:-1]])
+    starts = np.flatnonzero(first)
+    shadowed = np.zeros(len(order), dtype=bool)
+    for start, end in zip(starts, np.append(starts[1:], len(order))):
+        members = order[start:end]
+        min_x, min_y = cell_x[members[0]] * cell, cell_y[members[0]] * cell
+        near = grid.query(min(light.x, min_x) - 1, min(light.y, min_y) - 1,
+                          max(light.x, min_x + cell) + 1, max(light.y, min_y + cell) + 1)
+        if len(near):
+            shadowed[members] = shadowed_samples(light, px[members], py[members], dist_sq[members], near)
+    return shadowed
+
+
+def light_samples(light, px, py, grid):
+    # Lit samples among the points (px, py) and the light's intensity at each, as (indices, intensity)
+    dx = px - light.x
+    dy = py - light.y
+    dist_sq = dx * dx + dy * dy
+    index = np.flatnonzero(dist_sq < light.radius ** 2)
+    if len(index):
+        sample_dist_sq = dist_sq[index]
+        # Only walls overlapping the light's reach can hide a sample inside it (1px slack for rounding)
+        reach = light.radius + 1
+        near = grid.query(light.x - reach, light.y - reach, light.x + reach, light.y + reach)
+        if len(near) * len(index) > BATCH_PAIRS:
+            lit = ~shadowed_by_cell(light, px[index], py[index], sample_dist_sq, grid)
+            index, sample_dist_sq = index[lit], sample_dist_sq[lit]
+        elif len(near):
+            lit = ~shadowed_samples(light, px[index], py[index], sample_dist_sq, near)
+            index, sample_dist_sq = index[lit], sample_dist_sq[lit]
+    else:
+        sample_dist_sq = dist_sq[index]
+
+    falloff = 1.0 - (np.sqrt(sample_dist_sq) / light.radius)
+    return index, falloff * falloff * 0.6
+
+
+def sample_lightmap(lights, grid, columns, rows, step, first_row=0):
+    # Light levels at the samples of rows [first_row, first_row + rows), as a (columns, rows, 3) array
+    sample_x = np.repeat(np.arange(columns) * step, rows).astype(np.float64)
+    sample_y = np.tile(np.arange(first_row, first_row + rows) * step, columns).astype(np.float64)
+    totals = [np.full(columns * rows, float(level)) for level in AMBIENT]
+    for light in lights:
+        index, intensity = light_samples(light, sample_x, sample_y, grid)
+        for total, channel in zip(totals, light.colour):
+            total[index] = np.minimum(255, total[index] + channel * intensity)
+    return np.dstack([total.reshape(columns, rows) for total in totals])
+
+
+def render_lightmap(screen, lights, walls, step=12, pool=None):
+    # `pool` is an optional ParallelLightmapPool that renders bands of the lightmap on other cores
     width, height = screen.get_size()
-    # Small surface for pixelated lighting
-    light_surface = pygame.Surface((width // step, height // step))
-    light_surface.fill((20, 20, 20))  # ambient
-    light_surface.lock()
-
-    # Precompute wall segments for faster access
-    wall_segments = [(w.x1, w.y1, w.x2, w.y2) for w in walls]
-
-    for x in range(0, width, step):
-        for y in range(0, height, step):
-            total_r, total_g, total_b = 20, 20, 20  # ambient
-
-            for light in lights:
-                dx = x - light.x
-                dy = y - light.y
-                dist_sq = dx * dx + dy * dy
-
-                if dist_sq < light.radius ** 2:
-                    in_shadow = False
-                    for x1, y1, x2, y2 in wall_segments:
-                        hit = line_intersect(light.x, light.y, x, y, x1, y1, x2, y2)
-                        if hit:
-                            wx, wy = hit
-                            if (wx - light.x) ** 2 + (wy - light.y) ** 2 < dist_sq:
-                                in_shadow = True
-                                break
-                    if not in_shadow:
-                        distance = math.sqrt(dist_sq)
-                        falloff = 1.0 - (distance / light.radius)
-                        intensity = falloff * falloff * 0.6
-                        total_r = min(255, total_r + light.colour[0] * intensity)
-                        total_g = min(255, total_g + light.colour[1] * intensity)
-                        total_b = min(255, total_b + light.colour[2] * intensity)
-
-            light_surface.set_at((x // step, y // step), (int(total_r), int(total_g), int(total_b)))
-
-    light_surface.unlock()
+    # Small surface for pixelated lighting, one pixel per sample
+    columns, rows = width // step, height // step
+    light_surface = pygame.Surface((columns, rows))
+
+    if pool is not None and pool.worth_splitting(lights, walls, columns, rows):
+        levels = pool.sample_lightmap(lights, wall_array(walls), columns, rows, step)
+    else:
+        grid = walls if isinstance(walls, WallGrid) else WallGrid(walls)
+        levels = sample_lightmap(lights, grid, columns, rows, step)
+
+    pygame.surfarray.blit_array(light_surface, levels.astype(np.uint8))
     scaled = pygame.transform.scale(light_surface, (width, height))
     screen.blit(scaled, (0, 0), special_flags=pygame.BLEND_MULT)
+
+
+def visibility_polygon(light, grid):
+    # Angular sweep: cast a ray at each segment endpoint (and just either side of it) and keep the
+    # nearest hit. The hits, sorted by angle, outline everything the light can see.
+    x, y, r = light.x, light.y, light.radius
+    box = np.array([(x - r, y - r, x + r, y - r), (x + r, y - r, x + r, y + r),
+                    (x + r, y + r, x - r, y + r), (x - r, y + r, x - r, y - r)])
+    segments = np.vstack([grid.query(x - r, y - r, x + r, y + r), box])
+
+    endpoints = np.unique(np.vstack([segments[:, :2], segments[:, 2:]]), axis=0)
+    angles = np.arctan2(endpoints[:, 1] - y, endpoints[:, 0] - x)
+    angles = np.sort(np.concatenate([angles - SWEEP_EPSILON, angles, angles + SWEEP_EPSILON]))
+    ray_x, ray_y = np.cos(angles)[:, None], np.sin(angles)[:, None]
+
+    # Solve light + t * ray = start + u * (end - start) for every ray against every segment
+    seg_x = segments[:, 2] - segments[:, 0]
+    seg_y = segments[:, 3] - segments[:, 1]
+    offset_x = segments[:, 0] - x
+    offset_y = segments[:, 1] - y
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = ray_x * seg_y - ray_y * seg_x
+        t = (offset_x * seg_y - offset_y * seg_x) / denom
+        u = (offset_x * ray_y - offset_y * ray_x) / denom
+        t = np.where((np.abs(denom) > 1e-9) & (t >= 0) & (u >= 0) & (u <= 1), t, np.inf).min(axis=1)
+    return np.column_stack([x + ray_x[:, 0] * t, y + ray_y[:, 0] * t])
+
+
+def get_falloff_mask(radius, colour):
+    # Same falloff as render_lightmap, at full resolution and centred on pixel (r, r)
+    key = (radius, tuple(colour))
+    mask = falloff_masks.get(key)
+    if mask is None:
+        r = math.ceil(radius)
+        offsets = np.arange(-r, r + 1, dtype=np.float64)
+        distance = np.sqrt(offsets[:, None] ** 2 + offsets[None, :] ** 2)
+        falloff = np.where(distance < radius, 1.0 - distance / radius, 0.0)
+        intensity = falloff * falloff * 0.6
+        pixels = np.dstack([np.minimum(255, channel * intensity) for channel in colour]).astype(np.uint8)
+        mask = pygame.Surface((2 * r + 1, 2 * r + 1))
+        pygame.surfarray.blit_array(mask, pixels)
+        falloff_masks[key] = mask
+    return mask
+
+
+def render_visibility_lightmap(screen, lights, walls):
+    # Alternative to render_lightmap: each light's visibility polygon is filled, multiplied by the
+    # light's falloff and added onto the ambient light, then the result multiplies the screen.
+    # Cost depends on the number of walls near each light rather than on pixels x walls.
+    lightmap = pygame.Surface(screen.get_size())
+    lightmap.fill(AMBIENT)
+    grid = walls if isinstance(walls, WallGrid) else WallGrid(walls)
+
+    for light in lights:
+        mask = get_falloff_mask(light.radius, light.colour)
+        r = mask.get_width() // 2
+        origin_x, origin_y = round(light.x) - r, round(light.y) - r
+        polygon = visibility_polygon(light, grid) - (origin_x, origin_y)
+
+        lit = pygame.Surface(mask.get_size())
+        lit.fill((0, 0, 0))
+        pygame.draw.polygon(lit, (255, 255, 255), polygon.tolist())
+        lit.blit(mask, (0, 0), special_flags=pygame.BLEND_MULT)
+        lightmap.blit(lit, (origin_x, origin_y), special_flags=pygame.BLEND_ADD)
+
+    screen.blit(lightmap, (0, 0), special_flags=pygame.BLEND_MULT)
+
+
+def rays_cross_rect(x, y, px, py, min_x, min_y, max_x, max_y):
+    # Whether the segment from (x, y) to each point (px, py) touches the rectangle (slab test)
+    t_min = np.zeros(len(px))
+    t_max = np.ones(len(px))
+    for origin, target, low, high in ((x, px, min_x, max_x), (y, py, min_y, max_y)):
+        delta = target - origin
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t1 = (low - origin) / delta
+            t2 = (high - origin) / delta
+        parallel = delta == 0
+        inside = (low <= origin) & (origin <= high)
+        t_min = np.where(parallel, np.where(inside, t_min, np.inf), np.maximum(t_min, np.minimum(t1, t2)))
+        t_max = np.where(parallel, t_max, np.minimum(t_max, np.maximum(t1, t2)))
+    return t_min <= t_max
+
+
+class CachedLight:
+    # One light's contribution over the static walls, sampled on the world-aligned step grid
+    def __init__(self, light, step):
+        self.light = light  # In world coordinates
+        self.step = step
+        first_x = math.floor((light.x - light.radius) / step)
+        first_y = math.floor((light.y - light.radius) / step)
+        self.columns = math.ceil((light.x + light.radius) / step) - first_x + 1
+        self.rows = math.ceil((light.y + light.radius) / step) - first_y + 1
+        self.x, self.y = first_x * step, first_y * step  # World position of the top-left sample
+        self.sample_x = np.repeat(self.x + np.arange(self.columns) * step, self.rows).astype(np.float64)
+        self.sample_y = np.tile(self.y + np.arange(self.rows) * step, self.columns).astype(np.float64)
+        self.pixels = np.zeros((self.columns * self.rows, 3), dtype=np.uint8)
+        self.dirty = np.ones(self.columns * self.rows, dtype=bool)  # Samples to recompute before the next use
+        self.surface = None
+
+    def mark_dirty(self, min_x, min_y, max_x, max_y):
+        # Samples whose ray from the light passes through the changed rectangle (or that lie in it)
+        light = self.light
+        reach = light.radius + 1
+        if max_x < light.x - reach or min_x > light.x + reach or max_y < light.y - reach or min_y > light.y + reach:
+            return
+        self.dirty |= rays_cross_rect(light.x, light.y, self.sample_x, self.sample_y,
+                                      min_x - 1, min_y - 1, max_x + 1, max_y + 1)
+        self.surface = None
+
+    def update(self, grid):
+        if self.dirty.any():
+            dirty = np.flatnonzero(self.dirty)
+            index, intensity = light_samples(self.light, self.sample_x[dirty], self.sample_y[dirty], grid)
+            self.pixels[dirty] = 0
+            self.pixels[dirty[index]] = np.minimum(255, np.outer(intensity, self.light.colour)).astype(np.uint8)
+            self.dirty[:] = False
+        if self.surface is None:
+            small = pygame.Surface((self.columns, self.rows))
+            pygame.surfarray.blit_array(small, self.pixels.reshape(self.columns, self.rows, 3))
+            self.surface = pygame.transform.scale(small, (self.columns * self.step, self.rows * self.step))
+        return self.surface
+
+
+class LightmapCache:
+    # Keeps each light's sampled lightmap between frames, keyed by its quantised world position,
+    # radius and colour. Changed tiles only mark the samples they can shadow as dirty; those are
+    # recomputed the next time the light is drawn. A scene where nothing moved costs a few blits.
+    def __init__(self, walls, step=12, quantum=LIGHT_QUANTUM, max_lights=MAX_CACHED_LIGHTS):
+        self.walls = walls  # WallCache providing the static walls in world coordinates
+        self.step = step
+        self.quantum = quantum
+        self.max_lights = max_lights
+        self.lights = OrderedDict()  # (x, y, radius, colour) -> CachedLight, least recently used first
+        self.pending_walls = {}  # Key -> WallGrid from fetch_walls, used by the next render
+        self.lightmap = None
+
+    def invalidate(self, x, y):
+        # Called with tile coordinates when a tile changes
+        tile = self.walls.tile_size
+        self.pending_walls.clear()
+        for cached in self.lights.values():
+            cached.mark_dirty(x * tile, y * tile, (x + 1) * tile, (y + 1) * tile)
+
+    def lookup(self, x, y, radius, colour):
+        quantum = self.quantum
+        x, y = round(x / quantum) * quantum, round(y / quantum) * quantum
+        key = (x, y, radius, tuple(colour))
+        cached = self.lights.get(key)
+        if cached is None:
+            cached = CachedLight(Light(x, y, radius, colour), self.step)
+            self.lights[key] = cached
+            if len(self.lights) > self.max_lights:
+                self.lights.popitem(last=False)
+        else:
+            self.lights.move_to_end(key)
+        return key, cached
+
+    def light_walls(self, light):
+        tile = self.walls.tile_size
+        reach = light.radius + tile
+        start_x = max(0, int((light.x - reach) // tile))
+        start_y = max(0, int((light.y - reach) // tile))
+        end_x = min(self.walls.width, int((light.x + reach) // tile) + 1)
+        end_y = min(self.walls.height, int((light.y + reach) // tile) + 1)
+        return WallGrid(self.walls.get_walls(start_x, start_y, end_x, end_y, 0, 0, [light]))
+
+    def fetch_walls(self, lights, camera_x, camera_y):
+        # Optional step before render, so wall extraction can be timed apart from sampling: fetches
+        # the walls of every light whose lightmap is out of date. render uses them instead of its own.
+        for light in lights:
+            key, cached = self.lookup(light.x + camera_x, light.y + camera_y, light.radius, light.colour)
+            if cached.surface is None and key not in self.pending_walls:
+                self.pending_walls[key] = self.light_walls(cached.light)
+
+    def get_light(self, x, y, radius, colour):
+        key, cached = self.lookup(x, y, radius, colour)
+        if cached.surface is None:
+            grid = self.pending_walls.pop(key, None)
+            cached.update(grid if grid is not None else self.light_walls(cached.light))
+        return cached
+
+    def render(self, screen, lights, camera_x, camera_y):
+        # Same blending as render_lightmap; lights are given in screen coordinates
+        if self.lightmap is None or self.lightmap.get_size() != screen.get_size():
+            self.lightmap = pygame.Surface(screen.get_size())
+        self.lightmap.fill(AMBIENT)
+        for light in lights:
+            cached = self.get_light(light.x + camera_x, light.y + camera_y, light.radius, light.colour)
+            self.lightmap.blit(cached.surface, (cached.x - camera_x, cached.y - camera_y),
+                               special_flags=pygame.BLEND_ADD)
+        self.pending_walls.clear()
+        screen.blit(self.lightmap, (0, 0), special_flags=pygame.BLEND_MULT)
@@ -0,0 +1,90 @@
+import os
+import numpy as np
+from multiprocessing import Pool, resource_tracker, shared_memory
+from Lighting import Light, WallGrid, sample_lightmap
+
+# Below this many (sample, light, wall) tests a frame is rendered in-process; handing bands to
+# workers costs more than it saves. This is an estimate, not a measurement: set it per machine from
+# the point where `benchmark.py --parallel-lighting` shows a speedup over one process.
+PARALLEL_THRESHOLD = 2000000
+
+attached = {}  # Shared memory blocks a worker has opened, by name
+
+
+def attach(*names):
+    # Blocks the pool has since replaced are closed; the pool owns (and unlinks) every block
+    for name in list(attached):
+        if name not in names:
+            attached.pop(name).close()
+    for name in names:
+        if name not in attached:
+            attached[name] = shared_memory.SharedMemory(name=name)
+    return [attached[name].buf for name in names]
+
+
+def lightmap_work(lights, walls, columns, rows):
+    return columns * rows * len(lights) * max(1, len(walls))
+
+
+def render_band(inputs, output, wall_count, light_count, columns, rows, step, first_row, last_row):
+    # Runs in a worker: reads walls and lights from shared memory and writes its rows of the lightmap
+    buffer, result = attach(inputs, output)
+    walls = np.ndarray((wall_count, 4), dtype=np.float64, buffer=buffer)
+    packed = np.ndarray((light_count, 6), dtype=np.float64, buffer=buffer, offset=walls.nbytes)
+    lights = [Light(x, y, radius, (r, g, b)) for x, y, radius, r, g, b in packed.tolist()]
+    levels = np.ndarray((columns, rows, 3), dtype=np.float64, buffer=result)
+    levels[:, first_row:last_row] = sample_lightmap(lights, WallGrid(walls), columns, last_row - first_row,
+                                                    step, first_row)
+
+
+class ParallelLightmapPool:
+    # Splits render_lightmap's samples into horizontal bands rendered by a pool of worker processes.
+    # Walls, lights and the result are exchanged through shared memory, so a frame only sends each
+    # worker a few integers. Nothing in the game creates one: main.py and client.py light the world
+    # through LightmapCache. It is for callers of render_lightmap that re-render large lightmaps
+    # every frame on machines with spare cores.
+    def __init__(self, processes=None, threshold=PARALLEL_THRESHOLD):
+        self.processes = processes or os.cpu_count() or 1
+        self.threshold = threshold
+        # Workers must share this process's resource tracker, or each starts its own and unlinks the
+        # shared blocks it attached to when it exits
+        resource_tracker.ensure_running()
+        self.pool = Pool(self.processes)
+        self.inputs = None  # SharedMemory holding the walls followed by the packed lights
+        self.output = None  # SharedMemory holding the (columns, rows, 3) light levels
+
+    def worth_splitting(self, lights, walls, columns, rows):
+        return self.processes > 1 and lightmap_work(lights, walls, columns, rows) >= self.threshold
+
+    def reserve(self, block, size):
+        # Shared blocks are only replaced when they are too small; workers attach to new ones by name
+        if block is not None and block.size >= size:
+            return block
+        if block is not None:
+            block.close()
+            block.unlink()
+        return shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+    def sample_lightmap(self, lights, walls, columns, rows, step):
+        packed = np.array([(light.x, light.y, light.radius, *light.colour) for light in lights],
+                          dtype=np.float64).reshape(-1, 6)
+        self.inputs = self.reserve(self.inputs, walls.nbytes + packed.nbytes)
+        self.output = self.reserve(self.output, columns * rows * 3 * 8)
+        np.ndarray(walls.shape, dtype=np.float64, buffer=self.inputs.buf)[:] = walls
+        np.ndarray(packed.shape, dtype=np.float64, buffer=self.inputs.buf, offset=walls.nbytes)[:] = packed
+
+        bands = np.linspace(0, rows, min(self.processes, rows) + 1).astype(int)
+        self.pool.starmap(render_band, [
+            (self.inputs.name, self.output.name, len(walls), len(packed), columns, rows, step, first, last)
+            for first, last in zip(bands, bands[1:]) if first < last])
+        return np.ndarray((columns, rows, 3), dtype=np.float64, buffer=self.output.buf).copy()
+
+    def close(self):
+        # close/join rather than terminate: SDL turns SIGTERM into a quit event in forked workers
+        self.pool.close()
+        self.pool.join()
+        for block in (self.inputs, self.output):
+            if block is not None:
+                block.close()
+                block.unlink()
+        self.inputs = self.output = None
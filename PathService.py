@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from Pathfinding import Pathfinder, WalkabilityGrid
+from HierarchicalPathfinding import HierarchicalPathfinder
+
+HIERARCHICAL_DISTANCE = 64  # Searches spanning more than this many tiles are planned on the cluster graph
+PATH_CACHE_SIZE = 256
+
+
+class PathService:
+    # Runs path searches on a background thread. submit() returns a Future; the game loop checks
+    # future.done() each frame rather than waiting on it. Returned paths are shared, so treat them as read-only.
+    def __init__(self, width, height, lookup, hierarchical_distance=HIERARCHICAL_DISTANCE,
+                 cache_size=PATH_CACHE_SIZE):
+        # The worker has its own grid and searches, so nothing it writes is touched by the game loop
+        self.grid = WalkabilityGrid(width, height, lookup)
+        self.pathfinder = Pathfinder(self.grid)
+        self.hierarchy = HierarchicalPathfinder(self.grid)
+        self.hierarchical_distance = hierarchical_distance
+        self.cache_size = cache_size
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="PathService")
+
+        self.lock = threading.Lock()  # Guards the fields below
+        self.cache = OrderedDict()  # (start, end) -> path or None, least recently used first
+        self.pending = {}  # (start, end) -> (Future, version) of a search that has not finished yet
+        self.changed = []  # Tiles changed since the worker last refreshed its grid
+        self.version = 0  # Bumped on every tile change; results of searches started before one are not cached
+
+    def submit(self, start, end):
+        key = (tuple(start), tuple(end))
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                future = Future()
+                future.set_result(self.cache[key])
+                return future
+            # Identical requests share one search, unless a tile has changed since it started
+            future, version = self.pending.get(key, (None, None))
+            if future is None or version != self.version:
+                future = self.executor.submit(self.search, key, self.version)
+                self.pending[key] = (future, self.version)
+            return future
+
+    def search(self, key, version):
+        # Runs on the worker thread
+        with self.lock:
+            changed, self.changed = self.changed, []
+        for x, y in changed:
+            self.grid.invalidate(x, y)
+            self.hierarchy.invalidate(x, y)
+
+        try:
+            start, end = key
+            if max(abs(start[0] - end[0]), abs(start[1] - end[1])) > self.hierarchical_distance:
+                path = self.hierarchy.find_path(start, end)
+            else:
+                path = self.pathfinder.find_path(start, end)
+        except BaseException:
+            # Not cached; the exception reaches the caller through the Future
+            with self.lock:
+                self.finish(key, version)
+            raise
+        with self.lock:
+            self.finish(key, version)
+            if version == self.version:
+                self.cache[key] = path
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return path
+
+    def finish(self, key, version):
+        # Called with the lock held. A newer search for the same key may have replaced this one
+        if self.pending.get(key, (None, None))[1] == version:
+            del self.pending[key]
+
+    def tile_changed(self, x, y):
+        with self.lock:
+            self.changed.append((x, y))
+            self.version += 1
+            # Drop paths through the tile, and failures the change might have opened up
+            for key, path in list(self.cache.items()):
+                if path is None or (x, y) in path:
+                    del self.cache[key]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
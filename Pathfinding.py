@@ -1,108 +1,234 @@
+import heapq
 import math
-
-
-class Node:
-    def __init__(self, x: int, y: int, walkable: bool = True):
-        self.x = x
-        self.y = y
-        self.walkable = walkable
-        self.g_cost = 0  # Distance from start node
-        self.h_cost = 0  # Heuristic distance to end node
-        self.f_cost = 0  # Total cost (g + h)
-        self.parent = None
+from array import array
+
+DIAGONAL_COST = math.sqrt(2)
+
+# (dx, dy, cost) for the 8 moves a search may take from a cell
+DIRECTIONS = [
+    (-1, -1, DIAGONAL_COST), (-1, 0, 1.0), (-1, 1, DIAGONAL_COST),  # Left column
+    (0, -1, 1.0), (0, 1, 1.0),  # Middle column (skip center)
+    (1, -1, DIAGONAL_COST), (1, 0, 1.0), (1, 1, DIAGONAL_COST)  # Right column
+]
+
+UNKNOWN, WALKABLE, BLOCKED = 0, 1, 2
+
+
+class WalkabilityGrid:
+    def __init__(self, width, height, lookup):
+        self.width = width
+        self.height = height
+        self.lookup = lookup  # lookup(x, y) -> bool, only called the first time a cell is needed
+        self.cells = bytearray(width * height)  # Indexed y * width + x
+
+    @classmethod
+    def from_rows(cls, grid):
+        height = len(grid)
+        width = len(grid[0]) if height else 0
+        return cls(width, height, lambda x, y: grid[y][x] == 0)
+
+    def is_walkable(self, x, y):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+        index = y * self.width + x
+        state = self.cells[index]
+        if state == UNKNOWN:
+            state = WALKABLE if self.lookup(x, y) else BLOCKED
+            self.cells[index] = state
+        return state == WALKABLE
+
+    def invalidate(self, x, y):
+        # Call when the tile at (x, y) changes; it is looked up again on next use
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.cells[y * self.width + x] = UNKNOWN
 
 
 class Pathfinder:
     def __init__(self, grid):
-        self.height = len(grid)
-        self.width = len(grid[0]) if grid else 0
-        self.nodes = []
-
-        for y in range(self.height):
-            row = []
-            for x in range(self.width):
-                walkable = grid[y][x] == 0
-                row.append(Node(x, y, walkable))
-            self.nodes.append(row)
-
-    def get_node(self, x, y):
-        if 0 <= x < self.width and 0 <= y < self.height:
-            return self.nodes[y][x]
-        return None
-
-    def get_neighbors(self, node):
+        if not isinstance(grid, WalkabilityGrid):
+            grid = WalkabilityGrid.from_rows(grid)
+        self.grid = grid
+        self.width = grid.width
+        self.height = grid.height
+        self.is_walkable = grid.is_walkable
+
+        # Per-search state, indexed y * width + x. A cell's entries only count when its stamp
+        # matches the current search, so starting a search never has to clear the arrays.
+        size = self.width * self.height
+        self.g_costs = array('d', [0.0]) * size
+        self.parents = array('i', [-1]) * size
+        self.opened = array('I', [0]) * size
+        self.closed = array('I', [0]) * size
+        self.search_id = 0
+        self.expanded = 0  # Nodes expanded by the last search
+
+    def begin_search(self):
+        self.search_id += 1
+        if self.search_id > 0xFFFFFFFF:
+            # Stamps wrapped around, so old ones could match again
+            self.opened = array('I', [0]) * len(self.opened)
+            self.closed = array('I', [0]) * len(self.closed)
+            self.search_id = 1
+        self.expanded = 0
+        return self.search_id
+
+    def get_neighbors(self, x, y):
         neighbors = []
-        directions = [
-            (-1, -1), (-1, 0), (-1, 1),  # Left column
-            (0, -1), (0, 1),  # Middle column (skip center)
-            (1, -1), (1, 0), (1, 1)  # Right column
-        ]
-
-        for dx, dy in directions:
-            neighbor = self.get_node(node.x + dx, node.y + dy)
-            if neighbor and neighbor.walkable:
-                neighbors.append(neighbor)
-
+        for dx, dy, cost in DIRECTIONS:
+            if self.is_walkable(x + dx, y + dy):
+                neighbors.append((x + dx, y + dy, cost))
         return neighbors
 
-    def calculate_distance(self, node_a, node_b):
-        dx = abs(node_a.x - node_b.x)
-        dy = abs(node_a.y - node_b.y)
-        return math.sqrt(dx * dx + dy * dy)
-
-    def calculate_heuristic(self, node, target):
-        return abs(node.x - target.x) + abs(node.y - target.y)
-
-    def reconstruct_path(self, end_node):
+    def jump(self, x, y, dx, dy, end_x, end_y):
+        # Step from (x, y) in direction (dx, dy) until reaching the goal, a cell with a forced
+        # neighbour, or (for diagonals) a cell from which a straight jump finds one
+        is_walkable = self.is_walkable
+        while True:
+            x += dx
+            y += dy
+            if not is_walkable(x, y):
+                return None
+            if x == end_x and y == end_y:
+                return x, y
+
+            if dx and dy:
+                if ((is_walkable(x - dx, y + dy) and not is_walkable(x - dx, y)) or
+                        (is_walkable(x + dx, y - dy) and not is_walkable(x, y - dy))):
+                    return x, y
+                if self.jump(x, y, dx, 0, end_x, end_y) or self.jump(x, y, 0, dy, end_x, end_y):
+                    return x, y
+            elif dx:
+                if ((is_walkable(x + dx, y + 1) and not is_walkable(x, y + 1)) or
+                        (is_walkable(x + dx, y - 1) and not is_walkable(x, y - 1))):
+                    return x, y
+            else:
+                if ((is_walkable(x + 1, y + dy) and not is_walkable(x + 1, y)) or
+                        (is_walkable(x - 1, y + dy) and not is_walkable(x - 1, y))):
+                    return x, y
+
+    def get_pruned_directions(self, x, y, parent):
+        if parent == -1:
+            return [(dx, dy) for dx, dy, _ in DIRECTIONS]
+
+        is_walkable = self.is_walkable
+        dx = (x > parent % self.width) - (x < parent % self.width)
+        dy = (y > parent // self.width) - (y < parent // self.width)
+        if dx and dy:
+            directions = [(dx, dy), (dx, 0), (0, dy)]
+            if not is_walkable(x - dx, y):
+                directions.append((-dx, dy))
+            if not is_walkable(x, y - dy):
+                directions.append((dx, -dy))
+        elif dx:
+            directions = [(dx, 0)]
+            if not is_walkable(x, y + 1):
+                directions.append((dx, 1))
+            if not is_walkable(x, y - 1):
+                directions.append((dx, -1))
+        else:
+            directions = [(0, dy)]
+            if not is_walkable(x + 1, y):
+                directions.append((1, dy))
+            if not is_walkable(x - 1, y):
+                directions.append((-1, dy))
+        return directions
+
+    def get_jump_points(self, x, y, parent, end_x, end_y):
+        jump_points = []
+        for dx, dy in self.get_pruned_directions(x, y, parent):
+            jump_point = self.jump(x, y, dx, dy, end_x, end_y)
+            if jump_point:
+                jx, jy = jump_point
+                # Jump points lie on a straight or diagonal line, so octile distance is the exact cost
+                jump_points.append((jx, jy, self.calculate_heuristic(x, y, jx, jy)))
+        return jump_points
+
+    def calculate_heuristic(self, x, y, target_x, target_y):
+        # Octile distance: exact on an open 8-connected grid, so it never overestimates
+        dx = abs(x - target_x)
+        dy = abs(y - target_y)
+        return dx + dy + (DIAGONAL_COST - 2) * min(dx, dy)
+
+    def reconstruct_path(self, parents, end_index):
         path = []
-        current = end_node
-
-        while current is not None:
-            path.append((current.x, current.y))
-            current = current.parent
+        current = end_index
+
+        while current != -1:
+            x, y = current % self.width, current // self.width
+            parent = parents[current]
+            path.append((x, y))
+            if parent != -1:
+                # Fill in the straight or diagonal run between jump points (adjacent for A*)
+                px, py = parent % self.width, parent // self.width
+                dx = (px > x) - (px < x)
+                dy = (py > y) - (py < y)
+                x += dx
+                y += dy
+                while (x, y) != (px, py):
+                    path.append((x, y))
+                    x += dx
+                    y += dy
+            current = parent
 
         return path[::-1]  # Reverse to get start->end path
 
-    def find_path(self, start, end):
-        start_node = self.get_node(start[0], start[1])
-        end_node = self.get_node(end[0], end[1])
+    def find_path(self, start, end, algorithm="astar"):
+        if algorithm not in ("astar", "jps"):
+            raise ValueError(f"Unknown pathfinding algorithm: {algorithm}")
+        jump_point_search = algorithm == "jps"
 
-        if not start_node or not end_node:
+        search_id = self.begin_search()
+        if not self.is_walkable(start[0], start[1]) or not self.is_walkable(end[0], end[1]):
             return None
 
-        if not start_node.walkable or not end_node.walkable:
-            return None
-
-        start_node.g_cost = 0
-        start_node.h_cost = self.calculate_heuristic(start_node, end_node)
-        start_node.f_cost = start_node.g_cost + start_node.h_cost
-
-        open_set = [start_node]
-        closed_set = set()
-
-        while open_set:
-            current_node = min(open_set, key=lambda n: n.f_cost)
-            open_set.remove(current_node)
-            closed_set.add(current_node)
-    
-            if current_node == end_node:
-                return self.reconstruct_path(current_node)
-
-            for neighbor in self.get_neighbors(current_node):
-                if neighbor in closed_set:
+        width = self.width
+        end_x, end_y = end
+        start_index = start[1] * width + start[0]
+        end_index = end_y * width + end_x
+
+        g_costs = self.g_costs
+        parents = self.parents
+        opened = self.opened
+        closed = self.closed
+
+        g_costs[start_index] = 0.0
+        parents[start_index] = -1
+        opened[start_index] = search_id
+        h_cost = self.calculate_heuristic(start[0], start[1], end_x, end_y)
+        # Entries are (f, h, index); superseded entries stay in the heap and are skipped when popped
+        open_heap = [(h_cost, h_cost, start_index)]
+
+        while open_heap:
+            _, _, current = heapq.heappop(open_heap)
+            if closed[current] == search_id:
+                continue
+            closed[current] = search_id
+            self.expanded += 1
+
+            if current == end_index:
+                return self.reconstruct_path(parents, current)
+
+            x = current % width
+            y = current // width
+            current_g = g_costs[current]
+            if jump_point_search:
+                successors = self.get_jump_points(x, y, parents[current], end_x, end_y)
+            else:
+                successors = self.get_neighbors(x, y)
+            for nx, ny, cost in successors:
+                neighbor = ny * width + nx
+                if closed[neighbor] == search_id:
                     continue
 
-                new_g_cost = current_node.g_cost + self.calculate_distance(current_node, neighbor)
-
-                if neighbor not in open_set:
-                    open_set.append(neighbor)
-                elif new_g_cost >= neighbor.g_cost:
+                new_g_cost = current_g + cost
+                if opened[neighbor] == search_id and new_g_cost >= g_costs[neighbor]:
                     continue
 
-                neighbor.parent = current_node
-                neighbor.g_cost = new_g_cost
-                neighbor.h_cost = self.calculate_heuristic(neighbor, end_node)
-                neighbor.f_cost = neighbor.g_cost + neighbor.h_cost
+                opened[neighbor] = search_id
+                parents[neighbor] = current
+                g_costs[neighbor] = new_g_cost
+                h_cost = self.calculate_heuristic(nx, ny, end_x, end_y)
+                heapq.heappush(open_heap, (new_g_cost + h_cost, h_cost, neighbor))
 
         return None
 
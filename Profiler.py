@@ -0,0 +1,92 @@
+import csv
+import json
+import time
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+
+PROFILE_WINDOW = 300  # Frames of samples kept per scope, about five seconds at 60 FPS
+PERCENTILES = (50, 95, 99)
+
+NULL_SCOPE = nullcontext()  # Handed out while disabled, so a scope costs one call and an if
+
+
+class Scope:
+    def __init__(self, samples):
+        self.samples = samples
+        self.began = []  # Start time of each open entry, so the same name can be entered again inside itself
+
+    def __enter__(self):
+        self.began.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        self.samples.append((time.perf_counter() - self.began.pop()) * 1000)
+        return False
+
+
+class Profiler:
+    # Named timing scopes around the stages of a frame:
+    #     with profiler.scope("lighting"):
+    #         ...
+    # Each scope keeps its last `window` durations in milliseconds
+    def __init__(self, enabled=False, window=PROFILE_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.scopes = OrderedDict()  # name -> Scope, in the order first seen
+
+    def scope(self, name):
+        if not self.enabled:
+            return NULL_SCOPE
+        scope = self.scopes.get(name)
+        if scope is None:
+            scope = self.scopes[name] = Scope(deque(maxlen=self.window))
+        return scope
+
+    def record(self, name, ms):
+        # Add a duration measured elsewhere, e.g. Clock.get_rawtime()
+        if self.enabled:
+            self.scope(name).samples.append(ms)
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        if self.enabled:
+            self.scopes.clear()
+
+    def stats(self):
+        # name -> {"count", "mean", "p50", "p95", "p99"} in milliseconds
+        result = OrderedDict()
+        for name, scope in self.scopes.items():
+            samples = sorted(scope.samples)
+            if not samples:
+                continue
+            entry = {"count": len(samples), "mean": sum(samples) / len(samples)}
+            for percentile in PERCENTILES:
+                # Nearest-rank percentile
+                rank = max(0, -(-percentile * len(samples) // 100) - 1)
+                entry[f"p{percentile}"] = samples[rank]
+            result[name] = entry
+        return result
+
+    def draw(self, screen, font, x, y, colour=(255, 255, 0)):
+        lines = [f"{'stage':<12}{'p50':>7}{'p95':>7}{'p99':>7}"]
+        for name, entry in self.stats().items():
+            lines.append(f"{name:<12}{entry['p50']:>7.2f}{entry['p95']:>7.2f}{entry['p99']:>7.2f}")
+        for i, text in enumerate(lines):
+            screen.blit(font.render(text, True, colour), (x, y + i * font.get_linesize()))
+
+    def export_csv(self, path):
+        # One row per sample, for offline analysis
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["stage", "sample", "ms"])
+            for name, scope in self.scopes.items():
+                for i, value in enumerate(scope.samples):
+                    writer.writerow([name, i, f"{value:.4f}"])
+
+    def export_json(self, path):
+        data = {
+            "stats": self.stats(),
+            "samples": {name: list(scope.samples) for name, scope in self.scopes.items()}
+        }
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
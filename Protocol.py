@@ -0,0 +1,176 @@
+import struct
+from collections import OrderedDict
+
+# Binary protocol, negotiated after SETUP (see server.py). Every message is a frame:
+#     uint32 body length, uint8 message type, body
+# Positions are fixed point, in 1/POSITION_SCALE pixels. The server sends SNAPSHOT frames holding
+# the players a client can see, encoded as a delta against the last snapshot the client acknowledged.
+# A snapshot holds at most MAX_SNAPSHOT_PLAYERS players of each kind (removed, delta, absolute).
+PROTOCOL_NAME = "binary"
+PROTOCOL_VERSION = 2  # 2: uint32 frame lengths and player ids
+POSITION_SCALE = 4
+SNAPSHOT_HISTORY = 64  # Unacknowledged snapshots kept before falling back to a full snapshot
+MAX_SNAPSHOT_PLAYERS = 0xFFFF
+MAX_FRAME_SIZE = 1 << 20  # Larger frames are rejected, so a bad length cannot make a reader wait on gigabytes
+
+MOVE, ACK, SNAPSHOT = 1, 2, 3
+
+HEADER = struct.Struct("!IB")
+MOVE_BODY = struct.Struct("!ii")  # x, y
+ACK_BODY = struct.Struct("!I")  # snapshot sequence number
+SNAPSHOT_HEADER = struct.Struct("!IIHHH")  # sequence, base sequence (0: empty), removed, deltas, absolutes
+REMOVED = struct.Struct("!I")  # player id
+DELTA = struct.Struct("!Ihh")  # player id, dx, dy from the base
+ABSOLUTE = struct.Struct("!Iii")  # player id, x, y
+
+
+def quantize(value):
+    return int(round(value * POSITION_SCALE))
+
+
+def dequantize(value):
+    value /= POSITION_SCALE
+    return int(value) if value.is_integer() else value
+
+
+def frame(kind, body):
+    if len(body) > MAX_FRAME_SIZE:
+        raise ValueError(f"frame of {len(body)} bytes is over MAX_FRAME_SIZE")
+    return HEADER.pack(len(body), kind) + body
+
+
+def check_length(length):
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"frame of {length} bytes is over MAX_FRAME_SIZE")
+
+
+def split_frames(buffer):
+    # Complete frames at the start of buffer as (type, body), and the bytes left over
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= HEADER.size:
+        length, kind = HEADER.unpack_from(buffer, offset)
+        check_length(length)
+        end = offset + HEADER.size + length
+        if end > len(buffer):
+            break
+        frames.append((kind, bytes(buffer[offset + HEADER.size:end])))
+        offset = end
+    return frames, buffer[offset:]
+
+
+async def read_frame(reader):
+    length, kind = HEADER.unpack(await reader.readexactly(HEADER.size))
+    check_length(length)
+    return kind, await reader.readexactly(length)
+
+
+def encode_move(x, y):
+    return frame(MOVE, MOVE_BODY.pack(quantize(x), quantize(y)))
+
+
+def decode_move(body):
+    x, y = MOVE_BODY.unpack(body)
+    return {"x": dequantize(x), "y": dequantize(y)}
+
+
+def encode_ack(sequence):
+    return frame(ACK, ACK_BODY.pack(sequence))
+
+
+def decode_ack(body):
+    return ACK_BODY.unpack(body)[0]
+
+
+def encode_snapshot(sequence, base_sequence, base, view):
+    # base and view map player id -> quantized (x, y)
+    removed = [player_id for player_id in base if player_id not in view]
+    deltas = []
+    absolutes = []
+    for player_id, (x, y) in view.items():
+        old = base.get(player_id)
+        if old is None:
+            absolutes.append(ABSOLUTE.pack(player_id, x, y))
+        elif old != (x, y):
+            dx, dy = x - old[0], y - old[1]
+            if -32768 <= dx <= 32767 and -32768 <= dy <= 32767:
+                deltas.append(DELTA.pack(player_id, dx, dy))
+            else:
+                absolutes.append(ABSOLUTE.pack(player_id, x, y))
+    if max(len(removed), len(deltas), len(absolutes)) > MAX_SNAPSHOT_PLAYERS:
+        raise ValueError(f"snapshot of {len(view)} players is over MAX_SNAPSHOT_PLAYERS")
+    header = SNAPSHOT_HEADER.pack(sequence, base_sequence, len(removed), len(deltas), len(absolutes))
+    return frame(SNAPSHOT, header + b"".join(REMOVED.pack(player_id) for player_id in removed) +
+                 b"".join(deltas) + b"".join(absolutes))
+
+
+def decode_snapshot(body, base):
+    # Returns (sequence, view); base is the view the snapshot was encoded against
+    sequence, _, removed, deltas, absolutes = SNAPSHOT_HEADER.unpack_from(body)
+    view = dict(base)
+    offset = SNAPSHOT_HEADER.size
+    for (player_id,) in REMOVED.iter_unpack(body[offset:offset + removed * REMOVED.size]):
+        view.pop(player_id, None)
+    offset += removed * REMOVED.size
+    for player_id, dx, dy in DELTA.iter_unpack(body[offset:offset + deltas * DELTA.size]):
+        x, y = view[player_id]
+        view[player_id] = (x + dx, y + dy)
+    offset += deltas * DELTA.size
+    for player_id, x, y in ABSOLUTE.iter_unpack(body[offset:offset + absolutes * ABSOLUTE.size]):
+        view[player_id] = (x, y)
+    return sequence, view
+
+
+def snapshot_base_sequence(body):
+    return SNAPSHOT_HEADER.unpack_from(body)[1]
+
+
+class SnapshotEncoder:
+    # Server side of one binary connection
+    def __init__(self, history=SNAPSHOT_HISTORY):
+        self.history = history
+        self.sequence = 0
+        self.sent = OrderedDict()  # sequence -> view, for snapshots sent since the acknowledged one
+        self.acked_sequence = 0
+        self.acked_view = {}
+        self.last_view = {}
+
+    def acknowledge(self, sequence):
+        view = self.sent.get(sequence)
+        if view is None:
+            return  # Older than the current base, or from before a reset
+        while self.sent:
+            if self.sent.popitem(last=False)[0] == sequence:
+                break
+        self.acked_sequence = sequence
+        self.acked_view = view
+
+    def encode(self, view):
+        # SNAPSHOT frame for view, or None if nothing changed since the last one sent
+        if view == self.last_view:
+            return None
+        if len(self.sent) >= self.history:
+            # The client has stopped acknowledging; start again from an empty base
+            self.sent.clear()
+            self.acked_sequence = 0
+            self.acked_view = {}
+        self.sequence += 1
+        self.sent[self.sequence] = view
+        self.last_view = view
+        return encode_snapshot(self.sequence, self.acked_sequence, self.acked_view, view)
+
+
+class SnapshotDecoder:
+    # Client side: keeps the snapshots the server may still use as a base
+    def __init__(self):
+        self.received = {0: {}}  # sequence -> view
+
+    def decode(self, body):
+        # Returns (sequence, view); the caller acknowledges the sequence
+        base_sequence = snapshot_base_sequence(body)
+        sequence, view = decode_snapshot(body, self.received[base_sequence])
+        # The server never goes back to a base older than the one it just used
+        self.received = {key: value for key, value in self.received.items() if key >= base_sequence}
+        self.received[0] = {}
+        self.received[sequence] = view
+        return sequence, view
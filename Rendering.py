@@ -0,0 +1,150 @@
+import pygame
+import numpy as np
+from collections import OrderedDict
+from worldGenerator import TILE_COLOURS
+
+MAX_TERRAIN_SURFACES = 12  # A 32x32 chunk of 32px tiles is a 1024x1024 surface, about 4MB
+PREFETCH_DISTANCE = 512  # Pixels ahead of the camera, in its direction of travel, whose chunks are drawn early
+PREFETCH_PER_FRAME = 1  # Chunks pre-rendered per frame, so prefetching never costs more than one chunk
+SCROLL_MARGIN = 1  # Tiles kept drawn around the view on each side by ScrollingTerrainRenderer
+
+
+class TerrainRenderer:
+    # Terrain drawn once per chunk into off-screen surfaces (least recently used evicted); a frame
+    # blits the few chunks overlapping the camera instead of one rect per tile
+    def __init__(self, chunks, width, height, tile_size, max_surfaces=MAX_TERRAIN_SURFACES):
+        self.chunks = chunks  # ChunkStore
+        self.width = width  # World size in tiles; tiles outside it stay black
+        self.height = height
+        self.tile_size = tile_size
+        self.max_surfaces = max_surfaces
+        self.surfaces = OrderedDict()  # (chunk_x, chunk_y) -> Surface, least recently used first
+        self.colours = np.array(TILE_COLOURS, dtype=np.uint8)
+        self.last_camera = None
+
+    def chunk_pixels(self):
+        return self.chunks.chunk_size * self.tile_size
+
+    def render_chunk(self, chunk_x, chunk_y):
+        size = self.chunks.chunk_size
+        tiles = np.frombuffer(self.chunks.get_chunk(chunk_x, chunk_y), dtype=np.uint8).reshape(size, size)
+        colours = self.colours[tiles]
+        colours[:, max(0, self.width - chunk_x * size):] = 0
+        colours[max(0, self.height - chunk_y * size):, :] = 0
+        # One pixel per tile, (x, y) ordered for surfarray, then scaled up to tile size
+        small = pygame.Surface((size, size))
+        pygame.surfarray.blit_array(small, colours.transpose(1, 0, 2))
+        return pygame.transform.scale(small, (size * self.tile_size, size * self.tile_size))
+
+    def get_surface(self, chunk_x, chunk_y):
+        key = (chunk_x, chunk_y)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.render_chunk(chunk_x, chunk_y)
+            self.surfaces[key] = surface
+            if len(self.surfaces) > self.max_surfaces:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+    def tile_changed(self, x, y):
+        # Repaint the tile on its chunk's surface if that chunk is cached
+        size = self.chunks.chunk_size
+        surface = self.surfaces.get((x // size, y // size))
+        if surface is not None:
+            tile = self.tile_size
+            surface.fill(TILE_COLOURS[self.chunks.get_tile(x, y)],
+                         ((x % size) * tile, (y % size) * tile, tile, tile))
+
+    def chunks_in_view(self, left, top, right, bottom):
+        # Chunk keys overlapping the pixel rectangle, clipped to the world
+        pixels = self.chunk_pixels()
+        last_x = (min(right, self.width * self.tile_size) - 1) // pixels
+        last_y = (min(bottom, self.height * self.tile_size) - 1) // pixels
+        return [(chunk_x, chunk_y)
+                for chunk_y in range(max(0, top // pixels), last_y + 1)
+                for chunk_x in range(max(0, left // pixels), last_x + 1)]
+
+    def draw_region(self, target, left, top, right, bottom, offset_x, offset_y):
+        # Copy the world pixel rectangle onto target, with world (x, y) landing at (x + offset_x, y + offset_y)
+        pixels = self.chunk_pixels()
+        for chunk_x, chunk_y in self.chunks_in_view(left, top, right, bottom):
+            x, y = chunk_x * pixels, chunk_y * pixels
+            area = pygame.Rect(left - x, top - y, right - left, bottom - top).clip(0, 0, pixels, pixels)
+            target.blit(self.get_surface(chunk_x, chunk_y), (x + area.x + offset_x, y + area.y + offset_y), area)
+
+    def draw(self, screen, camera_x, camera_y):
+        width, height = screen.get_size()
+        self.draw_region(screen, camera_x, camera_y, camera_x + width, camera_y + height, -camera_x, -camera_y)
+        self.prefetch(camera_x, camera_y, width, height)
+
+    def prefetch(self, camera_x, camera_y, width, height):
+        last, self.last_camera = self.last_camera, (camera_x, camera_y)
+        if last is None:
+            return
+        dx = (camera_x > last[0]) - (camera_x < last[0])
+        dy = (camera_y > last[1]) - (camera_y < last[1])
+        if not dx and not dy:
+            return
+        ahead_x = camera_x + dx * PREFETCH_DISTANCE
+        ahead_y = camera_y + dy * PREFETCH_DISTANCE
+        missing = [key for key in self.chunks_in_view(ahead_x, ahead_y, ahead_x + width, ahead_y + height)
+                   if key not in self.surfaces]
+        for chunk_x, chunk_y in missing[:PREFETCH_PER_FRAME]:
+            self.get_surface(chunk_x, chunk_y)
+
+
+class ScrollingTerrainRenderer:
+    # Keeps the view plus a margin of tiles drawn in one buffer. When the camera crosses into new tiles
+    # the buffer is scrolled and only the exposed strips are copied from the chunk surfaces, so a
+    # frame costs one blit plus work proportional to how far the camera moved.
+    def __init__(self, terrain, margin=SCROLL_MARGIN):
+        self.terrain = terrain  # TerrainRenderer the strips are copied from
+        self.margin = margin
+        self.buffer = None
+        self.origin = None  # World tile at the buffer's top-left corner
+        self.columns = self.rows = 0  # Buffer size in tiles
+
+    def tile_changed(self, x, y):
+        self.terrain.tile_changed(x, y)
+        if self.buffer is not None:
+            left, top = x - self.origin[0], y - self.origin[1]
+            if 0 <= left < self.columns and 0 <= top < self.rows:
+                self.draw_tiles(left, top, 1, 1)
+
+    def draw_tiles(self, left, top, columns, rows):
+        # Redraw a block of buffer tiles (buffer tile coordinates)
+        tile = self.terrain.tile_size
+        origin_x, origin_y = self.origin[0] * tile, self.origin[1] * tile
+        self.buffer.fill((0, 0, 0), (left * tile, top * tile, columns * tile, rows * tile))
+        self.terrain.draw_region(self.buffer, origin_x + left * tile, origin_y + top * tile,
+                                 origin_x + (left + columns) * tile, origin_y + (top + rows) * tile,
+                                 -origin_x, -origin_y)
+
+    def draw(self, screen, camera_x, camera_y):
+        width, height = screen.get_size()
+        tile = self.terrain.tile_size
+        columns = -(-width // tile) + 1 + 2 * self.margin
+        rows = -(-height // tile) + 1 + 2 * self.margin
+        origin = (int(camera_x) // tile - self.margin, int(camera_y) // tile - self.margin)
+
+        if self.buffer is None or (columns, rows) != (self.columns, self.rows):
+            self.buffer = pygame.Surface((columns * tile, rows * tile))
+            self.columns, self.rows = columns, rows
+            self.origin = origin
+            self.draw_tiles(0, 0, columns, rows)
+        elif origin != self.origin:
+            dx, dy = origin[0] - self.origin[0], origin[1] - self.origin[1]
+            self.origin = origin
+            if abs(dx) >= columns or abs(dy) >= rows:
+                self.draw_tiles(0, 0, columns, rows)
+            else:
+                self.buffer.scroll(-dx * tile, -dy * tile)
+                if dx:
+                    self.draw_tiles(columns - dx if dx > 0 else 0, 0, abs(dx), rows)
+                if dy:
+                    self.draw_tiles(0, rows - dy if dy > 0 else 0, columns, abs(dy))
+
+        screen.blit(self.buffer, (0, 0), (camera_x - origin[0] * tile, camera_y - origin[1] * tile, width, height))
+        self.terrain.prefetch(camera_x, camera_y, width, height)
@@ -0,0 +1,394 @@
+import os
+import sys
+import json
+import random
+import argparse
+import platform
+import statistics
+import time
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Headless: nothing here opens a window
+import pygame
+import main
+from worldGenerator import PerlinNoise, ChunkStore, TILE_PASSABLE, GRASS, MOUNTAIN
+from Pathfinding import Pathfinder, WalkabilityGrid
+from Lighting import Light, render_lightmap
+from ParallelLighting import ParallelLightmapPool, PARALLEL_THRESHOLD, lightmap_work
+from server import GameServer
+from Protocol import SnapshotEncoder, SnapshotDecoder, split_frames
+
+WORLD_SIZE = 1000
+SEEDS = [1, 42, 1234]
+QUERIES_PER_SEED = 20
+LIGHTING_FRAMES = 10
+
+BASELINE_FILE = "benchmark_baseline.json"
+REGRESSION_THRESHOLD = 0.2  # A scenario more than 20% slower than its baseline is flagged
+REPEATS = 5  # Each scenario reports the median of this many runs
+SUITE_SEED = 7
+NOISE_SIZES = (64, 256, 512)
+PATH_WORLD_SIZE = 256
+PATH_TARGETS = {"short": 10, "long": 200}  # Spread in tiles between start and end
+LIGHTING_CASES = [(1, 0.05), (4, 0.05), (4, 0.2), (16, 0.2)]  # (lights, wall density)
+DRAW_FRAMES = 120
+PROTOCOL_PLAYERS = 100
+PROTOCOL_SECONDS = 10  # Simulated seconds of server ticks
+PROTOCOL_AREA = 3000  # Pixels square the players walk in, so most are within each other's interest radius
+ACK_LAG = 2  # Ticks before a snapshot is acknowledged, standing in for round-trip time
+
+
+def make_walkability(seed, size=WORLD_SIZE):
+    chunks = ChunkStore(PerlinNoise(seed))
+    return WalkabilityGrid(size, size, lambda x, y: TILE_PASSABLE[chunks.get_tile(x, y)])
+
+
+def random_walkable_tile(grid, rng, centre, spread):
+    while True:
+        x = min(grid.width - 1, max(0, centre[0] + rng.randint(-spread, spread)))
+        y = min(grid.height - 1, max(0, centre[1] + rng.randint(-spread, spread)))
+        if grid.is_walkable(x, y):
+            return x, y
+
+
+def make_queries(grid, seed, count=QUERIES_PER_SEED, spread=150):
+    rng = random.Random(seed)
+    centre = (grid.width // 2, grid.height // 2)
+    return [(random_walkable_tile(grid, rng, centre, spread), random_walkable_tile(grid, rng, centre, spread))
+            for _ in range(count)]
+
+
+def benchmark_jps(seeds=SEEDS):
+    print(f"{'seed':>6} {'algorithm':>9} {'found':>6} {'expanded':>10} {'time (s)':>9}")
+    for seed in seeds:
+        grid = make_walkability(seed)
+        queries = make_queries(grid, seed)
+        pathfinder = Pathfinder(grid)
+        costs = {}
+        for algorithm in ("astar", "jps"):
+            found = expanded = 0
+            elapsed = 0.0
+            costs[algorithm] = []
+            for start, end in queries:
+                began = time.perf_counter()
+                path = pathfinder.find_path(start, end, algorithm)
+                elapsed += time.perf_counter() - began
+                expanded += pathfinder.expanded
+                if path:
+                    found += 1
+                    costs[algorithm].append(path_cost(path))
+                else:
+                    costs[algorithm].append(None)
+            print(f"{seed:>6} {algorithm:>9} {found:>6} {expanded:>10} {elapsed:>9.3f}")
+
+        for astar_cost, jps_cost in zip(costs["astar"], costs["jps"]):
+            if (astar_cost is None) != (jps_cost is None) or (astar_cost and abs(astar_cost - jps_cost) > 1e-6):
+                print(f"  path cost mismatch for seed {seed}: A* {astar_cost}, JPS {jps_cost}")
+
+
+def path_cost(path):
+    cost = 0.0
+    for (x1, y1), (x2, y2) in zip(path, path[1:]):
+        cost += 2 ** 0.5 if x1 != x2 and y1 != y2 else 1.0
+    return cost
+
+
+def make_lighting_scene(seed, width=800, height=600, light_count=8, density=0.1):
+    # Random blocks of four tile edges and coloured lights, in screen coordinates
+    rng = random.Random(seed)
+    walls = []
+    for y in range(-64, height + 64, 32):
+        for x in range(-64, width + 64, 32):
+            if rng.random() < density:
+                walls += [(x, y, x + 32, y), (x + 32, y, x + 32, y + 32), (x + 32, y + 32, x, y + 32), (x, y + 32, x, y)]
+    lights = [Light(rng.uniform(0, width), rng.uniform(0, height), rng.choice([120, 200]),
+                    (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))) for _ in range(light_count)]
+    return lights, np.array(walls, dtype=np.float64)
+
+
+def benchmark_parallel_lighting(steps=(4, 2), seed=1):
+    screen = pygame.Surface((800, 600))
+    lights, walls = make_lighting_scene(seed)
+    counts = sorted({1, 2, 4, os.cpu_count() or 1})
+    # The work column is what ParallelLightmapPool compares with its threshold
+    print(f"PARALLEL_THRESHOLD {PARALLEL_THRESHOLD}")
+    print(f"{'step':>4} {'work':>11} {'processes':>9} {'ms/frame':>9} {'speedup':>8}")
+    for step in steps:
+        work = lightmap_work(lights, walls, 800 // step, 600 // step)
+        baseline = None
+        for processes in counts:
+            pool = ParallelLightmapPool(processes, threshold=0) if processes > 1 else None
+            began = time.perf_counter()
+            for _ in range(LIGHTING_FRAMES):
+                render_lightmap(screen, lights, walls, step, pool)
+            elapsed = (time.perf_counter() - began) / LIGHTING_FRAMES
+            if pool:
+                pool.close()
+            baseline = baseline or elapsed
+            print(f"{step:>4} {work:>11} {processes:>9} {elapsed * 1000:>9.1f} {baseline / elapsed:>8.2f}")
+
+
+class RecordingClient:
+    # Stands in for server.Client and keeps what the server would have written to it
+    def __init__(self, player_id, binary):
+        self.player_id = player_id
+        self.visible = set()
+        self.snapshots = SnapshotEncoder() if binary else None
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+
+def simulate_protocol(binary, players=PROTOCOL_PLAYERS, seconds=PROTOCOL_SECONDS, seed=SUITE_SEED):
+    # Players walk at client speed while the server ticks. Returns (bytes sent, messages,
+    # seconds spent in tick(), seconds spent decoding on the clients)
+    rng = random.Random(seed)
+    server = GameServer(world_seed=seed)
+    steps_per_tick = main.FPS // server.tick_rate
+    walkers = {}
+    for player_id in range(1, players + 1):
+        server.clients[player_id] = RecordingClient(player_id, binary)
+        walkers[player_id] = [rng.randrange(PROTOCOL_AREA), rng.randrange(PROTOCOL_AREA),
+                              rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1))]
+        server.move(player_id, {"x": walkers[player_id][0], "y": walkers[player_id][1]})
+    decoders = {player_id: SnapshotDecoder() for player_id in walkers}
+    acks = {player_id: [] for player_id in walkers}
+
+    sent = messages = 0
+    tick_time = decode_time = 0.0
+    for _ in range(int(seconds * server.tick_rate)):
+        for player_id, walker in walkers.items():
+            if rng.random() < 0.05:
+                walker[2], walker[3] = rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1))
+            walker[0] = min(PROTOCOL_AREA, max(0, walker[0] + walker[2] * 3 * steps_per_tick))
+            walker[1] = min(PROTOCOL_AREA, max(0, walker[1] + walker[3] * 3 * steps_per_tick))
+            if walker[2] or walker[3]:
+                server.move(player_id, {"x": walker[0], "y": walker[1]})
+
+        began = time.perf_counter()
+        server.tick()
+        tick_time += time.perf_counter() - began
+
+        for player_id, client in server.clients.items():
+            data = b"".join(client.sent)
+            client.sent.clear()
+            sent += len(data)
+            began = time.perf_counter()
+            if binary:
+                frames, _ = split_frames(data)
+                for _, body in frames:
+                    sequence, _ = decoders[player_id].decode(body)
+                    acks[player_id].append(sequence)
+                messages += len(frames)
+            else:
+                lines = data.splitlines()
+                for line in lines:
+                    json.loads(line)
+                messages += len(lines)
+            decode_time += time.perf_counter() - began
+            while len(acks[player_id]) > ACK_LAG:
+                client.snapshots.acknowledge(acks[player_id].pop(0))
+    return sent, messages, tick_time, decode_time
+
+
+def benchmark_protocol(players=PROTOCOL_PLAYERS, seconds=PROTOCOL_SECONDS):
+    print(f"{players} players, {seconds}s at the server tick rate, acks {ACK_LAG} ticks behind")
+    print(f"{'protocol':>8} {'B/player/s':>11} {'messages':>9} {'tick ms':>8} {'decode msg/s':>13}")
+    for name, binary in (("json", False), ("binary", True)):
+        sent, messages, tick_time, decode_time = simulate_protocol(binary, players, seconds)
+        ticks = seconds * GameServer().tick_rate
+        print(f"{name:>8} {sent / players / seconds:>11.0f} {messages:>9} {tick_time / ticks * 1000:>8.2f} "
+              f"{messages / decode_time:>13.0f}")
+
+
+def time_median(run, repeats=REPEATS):
+    # run(timer) does its own setup and calls timer() around just the work being measured
+    samples = []
+
+    def timer(work):
+        began = time.perf_counter()
+        result = work()
+        samples.append(time.perf_counter() - began)
+        return result
+
+    for _ in range(repeats):
+        run(timer)
+    return statistics.median(samples)
+
+
+def suite_worldgen(seed=SUITE_SEED):
+    results = {}
+    for size in NOISE_SIZES:
+        perlin = PerlinNoise(seed)
+        results[f"worldgen/noise_map_{size}"] = time_median(
+            lambda timer: timer(lambda: perlin.generate_noise_map(size, size, 10.0)))
+    return results
+
+
+def enclose(world, x, y):
+    # Ring the tile with mountains so nothing outside can reach it
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            if dx or dy:
+                world.set_tile(x + dx, y + dy, MOUNTAIN)
+
+
+def suite_pathfinding(seed=SUITE_SEED, size=PATH_WORLD_SIZE):
+    world = main.World(size, size, seed)
+    world.paths.shutdown()
+    grid = world.walkability
+    centre = (size // 2, size // 2)
+    rng = random.Random(seed)
+    cases = {name: [(random_walkable_tile(grid, rng, centre, spread), random_walkable_tile(grid, rng, centre, spread))
+                    for _ in range(QUERIES_PER_SEED)]
+             for name, spread in PATH_TARGETS.items()}
+
+    # Unreachable: the end is walled in, so the search exhausts everything reachable from the start
+    start = random_walkable_tile(grid, rng, centre, 20)
+    end = random_walkable_tile(grid, rng, (start[0] + 40, start[1]), 5)
+    enclose(world, *end)
+    world.set_tile(end[0], end[1], GRASS)
+    cases["unreachable"] = [(start, end)]
+
+    pathfinder = Pathfinder(grid)
+    results = {}
+    for name, queries in cases.items():
+        for algorithm in ("astar", "jps"):
+            def run(timer):
+                for query_start, query_end in queries:
+                    path = timer(lambda: pathfinder.find_path(query_start, query_end, algorithm))
+                    if (path is None) != (name == "unreachable"):
+                        raise RuntimeError(f"pathfinding/{name}: unexpected result for {query_start} -> {query_end}")
+            # Median of single searches across all queries and repeats
+            results[f"pathfinding/{name}_{algorithm}"] = time_median(run)
+    return results
+
+
+def suite_lighting(seed=SUITE_SEED):
+    screen = pygame.Surface((main.SCREEN_WIDTH, main.SCREEN_HEIGHT))
+    results = {}
+    for light_count, density in LIGHTING_CASES:
+        lights, walls = make_lighting_scene(seed, light_count=light_count, density=density)
+        results[f"lighting/lights_{light_count}_walls_{len(walls)}"] = time_median(
+            lambda timer: timer(lambda: render_lightmap(screen, lights, walls)))
+    return results
+
+
+def suite_draw_world(seed=SUITE_SEED):
+    screen = pygame.Surface((main.SCREEN_WIDTH, main.SCREEN_HEIGHT))
+    centre = main.WORLD_WIDTH * main.TILE_SIZE // 2
+
+    def cold(timer):
+        # First frame of a fresh world: every visible chunk is generated and drawn
+        world = main.World(main.WORLD_WIDTH, main.WORLD_HEIGHT, seed)
+        world.paths.shutdown()
+        camera = main.Camera(main.SCREEN_WIDTH, main.SCREEN_HEIGHT)
+        camera.update(centre, centre)
+        timer(lambda: main.draw_world(screen, world, camera))
+
+    def scrolling(timer):
+        # The camera walking diagonally at player speed, averaged per frame
+        world = main.World(main.WORLD_WIDTH, main.WORLD_HEIGHT, seed)
+        world.paths.shutdown()
+        camera = main.Camera(main.SCREEN_WIDTH, main.SCREEN_HEIGHT)
+        camera.update(centre, centre)
+        main.draw_world(screen, world, camera)
+
+        def frames():
+            for frame in range(DRAW_FRAMES):
+                camera.update(centre + frame * 3, centre + frame * 2)
+                main.draw_world(screen, world, camera)
+        timer(frames)
+
+    return {"draw_world/cold": time_median(cold),
+            "draw_world/scroll_per_frame": time_median(scrolling) / DRAW_FRAMES}
+
+
+def suite_protocol(seed=SUITE_SEED, seconds=2):
+    # Per tick: the server's tick() for every client, and decoding on every client
+    results = {}
+    for name, binary in (("json", False), ("binary", True)):
+        runs = [simulate_protocol(binary, seconds=seconds, seed=seed) for _ in range(REPEATS)]
+        ticks = seconds * GameServer().tick_rate
+        results[f"protocol/{name}_tick"] = statistics.median(run[2] for run in runs) / ticks
+        results[f"protocol/{name}_decode_per_tick"] = statistics.median(run[3] for run in runs) / ticks
+    return results
+
+
+def run_suite():
+    results = {}
+    for suite in (suite_worldgen, suite_pathfinding, suite_lighting, suite_draw_world, suite_protocol):
+        results.update(suite())
+    return results
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    # Prints every scenario against the baseline and returns the names of the regressions
+    regressions = []
+    print(f"{'scenario':<40} {'ms':>9} {'baseline':>9} {'change':>8}")
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<40} {seconds * 1000:>9.3f} {'-':>9} {'new':>8}")
+            continue
+        change = seconds / before - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<40} {seconds * 1000:>9.3f} {before * 1000:>9.3f} {change:>+8.0%}{flag}")
+    return regressions
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    data = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeats": REPEATS,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def load_baseline(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)["results"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless benchmarks for world generation, pathfinding and rendering")
+    parser.add_argument("--save-baseline", action="store_true", help=f"write the results to {BASELINE_FILE}")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file to compare against or write")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="fractional slowdown flagged as a regression")
+    parser.add_argument("--jps", action="store_true", help="compare A* and JPS instead of running the suite")
+    parser.add_argument("--parallel-lighting", action="store_true",
+                        help="compare lightmap process counts instead of running the suite")
+    parser.add_argument("--protocol", action="store_true",
+                        help="compare JSON and binary bandwidth and throughput instead of running the suite")
+    args = parser.parse_args()
+
+    if args.jps or args.parallel_lighting or args.protocol:
+        if args.jps:
+            benchmark_jps()
+        if args.parallel_lighting:
+            benchmark_parallel_lighting()
+        if args.protocol:
+            benchmark_protocol()
+        sys.exit()
+
+    results = run_suite()
+    baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline or {}, args.threshold)
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+    elif baseline is None:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+    elif regressions:
+        print(f"{len(regressions)} scenario(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
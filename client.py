@@ -2,9 +2,14 @@ import pygame
 import sys
 import socket
 import json
+import time
 import threading
-from worldGenerator import PerlinNoise
-from Lighting import Light, Wall, render_lightmap
+from worldGenerator import PerlinNoise, ChunkStore, TILE_COLOURS, TILE_CASTS_SHADOW
+from Lighting import Light, WallCache, LightmapCache
+from Rendering import TerrainRenderer, ScrollingTerrainRenderer
+from Profiler import Profiler
+from Protocol import (PROTOCOL_NAME, PROTOCOL_VERSION, SNAPSHOT, SnapshotDecoder, split_frames, encode_move,
+                      encode_ack, dequantize)
 
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
@@ -12,9 +17,13 @@ WORLD_WIDTH = 1000
 WORLD_HEIGHT = 1000
 TILE_SIZE = 32
 FPS = 60
+PROFILE_FILE = "profile"  # P toggles the profiler overlay, O writes profile.csv and profile.json
 
 HOST = '127.0.0.1'
 PORT = 50000
+PROTOCOL = PROTOCOL_NAME  # "json" keeps newline-delimited JSON messages, which are easier to read when debugging
+SEND_RATE = 20  # MOVE messages per second at most; the server only broadcasts this often anyway
+SEND_COALESCE = 0.005  # Seconds the writer waits for more messages to join the same send
 
 
 class World:
@@ -22,43 +31,25 @@ class World:
         self.width = width
         self.height = height
         self.perlin = PerlinNoise(seed)
-        self.tile_map = self.generate_world()
-
-    def generate_world(self):
-        elevation_map = self.perlin.generate_noise_map(self.width, self.height, 20.0)
-        moisture_map = self.perlin.generate_noise_map(self.width, self.height, 15.0)
-        tile_map = []
-        for y in range(self.height):
-            row = []
-            for x in range(self.width):
-                elevation = elevation_map[y][x]
-                moisture = moisture_map[y][x]
-                if elevation < 0.3:
-                    row.append('water')
-                elif elevation < 0.4:
-                    row.append('sand')
-                elif elevation < 0.7:
-                    if moisture > 0.6:
-                        row.append('forest')
-                    elif moisture > 0.3:
-                        row.append('grass')
-                    else:
-                        row.append('dirt')
-                else:
-                    row.append('mountain')
-            tile_map.append(row)
-        return tile_map
+        self.chunks = ChunkStore(self.perlin)
+        self.walls = WallCache(self.chunks, width, height, TILE_SIZE)
+        self.lightmaps = LightmapCache(self.walls, step=25)
+        self.terrain = ScrollingTerrainRenderer(TerrainRenderer(self.chunks, width, height, TILE_SIZE))
+
+    def get_tile(self, x, y):
+        return self.chunks.get_tile(x, y)
+
+    def set_tile(self, x, y, tile_type):
+        self.chunks.set_tile(x, y, tile_type)
+        self.walls.invalidate(x, y)
+        self.lightmaps.invalidate(x, y)
+        self.terrain.tile_changed(x, y)
 
     def get_tile_color(self, tile_type):
-        colors = {
-            'water': (173, 216, 230),
-            'sand': (238, 203, 173),
-            'grass': (0, 255, 0),
-            'forest': (0, 150, 0),
-            'dirt': (139, 69, 19),
-            'mountain': (128, 128, 128)
-        }
-        return colors.get(tile_type, (255, 255, 255))
+        return TILE_COLOURS[tile_type]
+
+    def casts_shadow(self, tile_type):
+        return TILE_CASTS_SHADOW[tile_type]
 
 
 class Player:
@@ -99,48 +90,127 @@ class Camera:
 
 
 class NetworkClient:
-    def __init__(self):
+    def __init__(self, protocol=PROTOCOL, send_rate=SEND_RATE):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.connect((HOST, PORT))
+        # Messages are batched by the writer thread, so the kernel need not delay them as well
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.player_id = None
         self.world_seed = None
         self.other_players = {}  # player_id -> {"x":, "y":}
+        self.protocol = protocol
+        self.negotiating = False  # MOVEs are held back until the server answers our PROTOCOL request
+        self.binary = False
+        self.snapshots = SnapshotDecoder()
+
+        # Only the writer thread touches the socket for sending; the fields below are guarded by send_ready
+        self.send_ready = threading.Condition()
+        self.outgoing = []  # Encoded messages waiting to be written
+        self.pending_move = None  # Latest position not yet sent; newer positions replace it
+        self.next_move_time = 0.0  # time.monotonic() before which no MOVE is sent
+        self.send_interval = 1.0 / send_rate
+        self.last_move = None  # Last position handed to the writer (game loop only)
 
         threading.Thread(target=self.recv_loop, daemon=True).start()
+        threading.Thread(target=self.send_loop, daemon=True).start()
+
+    def enqueue(self, data):
+        with self.send_ready:
+            self.outgoing.append(data)
+            self.send_ready.notify()
+
+    def send_loop(self):
+        while True:
+            with self.send_ready:
+                while not self.outgoing:
+                    if self.pending_move is not None:
+                        delay = self.next_move_time - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self.send_ready.wait(delay)
+                    else:
+                        self.send_ready.wait()
+            # Let anything else produced this frame go out in the same segment
+            time.sleep(SEND_COALESCE)
+            with self.send_ready:
+                data, self.outgoing = self.outgoing, []
+                now = time.monotonic()
+                if self.pending_move is not None and now >= self.next_move_time:
+                    data.append(self.encode_move(*self.pending_move))
+                    self.pending_move = None
+                    self.next_move_time = now + self.send_interval
+            try:
+                self.sock.sendall(b"".join(data))
+            except OSError as e:
+                print("Connection lost:", e)
+                break
 
     def recv_loop(self):
-        buffer = ""
+        buffer = b""
         while True:
             try:
-                data = self.sock.recv(4096).decode()
+                data = self.sock.recv(4096)
                 if not data:
                     continue
                 buffer += data
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    if not line.strip():
-                        continue
-                    packet = json.loads(line)
-                    if packet["command"] == "SETUP":
-                        self.player_id = packet["data"]["PlayerID"]
-                        self.world_seed = packet["data"]["WorldSeed"]
-                        self.x = packet["data"]["PlayerX"]
-                        self.y = packet["data"]["PlayerY"]
-                    elif packet["command"] == "UPDATE_POS":
-                        for pid, pos in packet["data"].items():
-                            self.other_players[pid] = pos
+                while not self.binary and b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    if line.strip():
+                        self.handle_packet(json.loads(line))
+                if self.binary:
+                    frames, buffer = split_frames(buffer)
+                    for kind, body in frames:
+                        self.handle_frame(kind, body)
             except Exception as e:
                 print("Connection lost:", e)
                 break
 
+    def handle_packet(self, packet):
+        if packet["command"] == "SETUP":
+            offered = packet["data"].get("Protocols", [])
+            if self.protocol == PROTOCOL_NAME and {"name": PROTOCOL_NAME, "version": PROTOCOL_VERSION} in offered:
+                self.negotiating = True
+                self.enqueue((json.dumps({"command": "PROTOCOL",
+                                          "data": {"name": PROTOCOL_NAME, "version": PROTOCOL_VERSION}}) + "\n").encode())
+            self.player_id = packet["data"]["PlayerID"]
+            self.world_seed = packet["data"]["WorldSeed"]
+            self.x = packet["data"]["PlayerX"]
+            self.y = packet["data"]["PlayerY"]
+        elif packet["command"] == "PROTOCOL":
+            # Last JSON line when the server accepted binary; frames follow it
+            self.binary = packet["data"]["name"] == PROTOCOL_NAME
+            self.negotiating = False
+        elif packet["command"] in ("ENTER", "UPDATE_POS"):
+            # The server only reports players near us; JSON turns the ids into strings
+            for pid, pos in packet["data"].items():
+                if int(pid) != self.player_id:
+                    self.other_players[pid] = pos
+        elif packet["command"] == "LEAVE":
+            for pid in packet["data"]:
+                self.other_players.pop(str(pid), None)
+
+    def handle_frame(self, kind, body):
+        if kind == SNAPSHOT:
+            sequence, view = self.snapshots.decode(body)
+            # Keyed like the JSON messages so drawing does not care which protocol is in use
+            self.other_players = {str(pid): {"x": dequantize(x), "y": dequantize(y)} for pid, (x, y) in view.items()}
+            self.enqueue(encode_ack(sequence))
+
     def send_move(self, x, y):
-        if self.player_id is None:
+        # Called every frame by the game loop. Never blocks: the position is handed to the writer
+        # thread, which sends the latest one at most send_rate times a second, and nothing while
+        # the player stands still
+        if self.player_id is None or self.negotiating or (x, y) == self.last_move:
             return
-        packet = {"command": "MOVE", "data": {"x": x, "y": y}}
-        try:
-            self.sock.send((json.dumps(packet) + "\n").encode())
-        except:
-            pass
+        self.last_move = (x, y)
+        with self.send_ready:
+            self.pending_move = (x, y)
+            self.send_ready.notify()
+
+    def encode_move(self, x, y):
+        if self.binary:
+            return encode_move(x, y)
+        return (json.dumps({"command": "MOVE", "data": {"x": x, "y": y}}) + "\n").encode()
 
 
 def main():
@@ -158,12 +228,20 @@ def main():
     world = World(WORLD_WIDTH, WORLD_HEIGHT, network.world_seed)
     player = Player(network.x, network.y)
     camera = Camera(SCREEN_WIDTH, SCREEN_HEIGHT)
+    profiler = Profiler()
+    profile_font = pygame.font.SysFont("consolas,couriernew,monospace", 16)
 
     running = True
     while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_p:
+                    profiler.toggle()
+                elif event.key == pygame.K_o:
+                    profiler.export_csv(PROFILE_FILE + ".csv")
+                    profiler.export_json(PROFILE_FILE + ".json")
 
         keys = pygame.key.get_pressed()
         dx = dy = 0
@@ -174,53 +252,38 @@ def main():
 
         player.move(dx, dy, world)
         camera.update(player.x + player.width // 2, player.y + player.height // 2)
-        network.send_move(player.x, player.y)
-
-        screen.fill((0, 0, 0))
-        start_x = max(0, camera.x // TILE_SIZE)
-        end_x = min(world.width, (camera.x + camera.width) // TILE_SIZE + 1)
-        start_y = max(0, camera.y // TILE_SIZE)
-        end_y = min(world.height, (camera.y + camera.height) // TILE_SIZE + 1)
-        for y in range(start_y, end_y):
-            for x in range(start_x, end_x):
-                color = world.get_tile_color(world.tile_map[y][x])
-                screen.fill(color, rect=(x * TILE_SIZE - camera.x, y * TILE_SIZE - camera.y, TILE_SIZE, TILE_SIZE))
-
-        walls = []
-        margin = 2
-        for y in range(start_y - margin, end_y + margin):
-            for x in range(start_x - margin, end_x + margin):
-                if 0 <= x < world.width and 0 <= y < world.height:
-                    tile = world.tile_map[y][x]
-                    if tile in ['mountain', 'forest']:
-                        wx = x * TILE_SIZE - camera.x
-                        wy = y * TILE_SIZE - camera.y
-                        walls.extend([
-                            Wall(wx, wy, wx + TILE_SIZE, wy),
-                            Wall(wx + TILE_SIZE, wy, wx + TILE_SIZE, wy + TILE_SIZE),
-                            Wall(wx + TILE_SIZE, wy + TILE_SIZE, wx, wy + TILE_SIZE),
-                            Wall(wx, wy + TILE_SIZE, wx, wy)
-                        ])
+        with profiler.scope("network"):
+            network.send_move(player.x, player.y)
+
+        with profiler.scope("draw_world"):
+            screen.fill((0, 0, 0))
+            world.terrain.draw(screen, camera.x, camera.y)
 
         lights = [
             Light(player.x - camera.x + player.width // 2,
                   player.y - camera.y + player.height // 2, 150, (255, 255, 255))
         ]
-        for pid, pos in network.other_players.items():
+        for pid, pos in list(network.other_players.items()):
             if pid != network.player_id:
                 lights.append(Light(pos["x"] - camera.x + 12,
                                     pos["y"] - camera.y + 12, 120, (255, 255, 255)))
+        with profiler.scope("walls"):
+            world.lightmaps.fetch_walls(lights, camera.x, camera.y)
+        with profiler.scope("lighting"):
+            world.lightmaps.render(screen, lights, camera.x, camera.y)
 
-        render_lightmap(screen, lights, walls, step=25)
-
-        for pid, pos in network.other_players.items():
+        for pid, pos in list(network.other_players.items()):
             if pid != network.player_id:
                 pygame.draw.rect(screen, (255, 255, 255),
                                  (pos["x"] - camera.x, pos["y"] - camera.y, 24, 24))
         player.draw(screen, camera)
+        if profiler.enabled:
+            profiler.draw(screen, profile_font, 10, 10)
 
-        pygame.display.flip()
+        with profiler.scope("present"):
+            pygame.display.flip()
         clock.tick(FPS)
+        profiler.record("frame", clock.get_rawtime())
 
     pygame.quit()
     sys.exit()
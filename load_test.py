@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+import subprocess
+from server import HOST
+from Protocol import (PROTOCOL_NAME, PROTOCOL_VERSION, HEADER, SNAPSHOT, SnapshotDecoder, read_frame,
+                      encode_move, encode_ack, dequantize)
+
+LOAD_TEST_PORT = 50100
+CLIENTS = 200
+MOVE_RATE = 20  # MOVE packets per second per simulated client
+DURATION = 10.0  # Seconds of sending, after every client has connected
+SLOW_CLIENTS = 0  # Clients that connect but never read, to check they cannot stall the others
+SPREAD = 32000  # Pixels; simulated players are placed between 0 and this on the y axis
+
+
+class Stats:
+    def __init__(self):
+        self.sent = {}  # (player_id, x) -> time the MOVE was sent
+        self.latencies = []  # Seconds from a MOVE being sent to another client receiving it
+        self.moves = 0
+        self.packets = 0
+        self.enters = 0
+        self.leaves = 0
+        self.updates = 0
+        self.bytes = 0
+        self.disconnected = 0
+
+
+async def simulated_client(host, port, stats, rate, spread, protocol, stop, rng):
+    reader, writer = await asyncio.open_connection(host, port)
+    setup = json.loads(await reader.readline())
+    player_id = setup["data"]["PlayerID"]
+    binary = False
+    if protocol == PROTOCOL_NAME:
+        request = {"command": "PROTOCOL", "data": {"name": PROTOCOL_NAME, "version": PROTOCOL_VERSION}}
+        writer.write((json.dumps(request) + "\n").encode())
+        while True:
+            packet = json.loads(await reader.readline())
+            if packet["command"] == "PROTOCOL":
+                binary = packet["data"]["name"] == PROTOCOL_NAME
+                break
+
+    def updated(pid, x, now):
+        stats.updates += 1
+        sent = stats.sent.get((pid, x))
+        if sent is not None:
+            stats.latencies.append(now - sent)
+
+    async def receive_json():
+        while True:
+            line = await reader.readline()
+            if not line:
+                stats.disconnected += 1
+                return
+            stats.bytes += len(line)
+            stats.packets += 1
+            packet = json.loads(line)
+            now = time.perf_counter()
+            if packet["command"] == "ENTER":
+                stats.enters += len(packet["data"])
+            elif packet["command"] == "LEAVE":
+                stats.leaves += len(packet["data"])
+            elif packet["command"] == "UPDATE_POS":
+                for pid, pos in packet["data"].items():
+                    if int(pid) != player_id:
+                        updated(int(pid), pos["x"], now)
+
+    async def receive_binary():
+        snapshots = SnapshotDecoder()
+        view = {}
+        while True:
+            try:
+                kind, body = await read_frame(reader)
+            except asyncio.IncompleteReadError:
+                stats.disconnected += 1
+                return
+            stats.bytes += HEADER.size + len(body)
+            stats.packets += 1
+            if kind != SNAPSHOT:
+                continue
+            now = time.perf_counter()
+            sequence, new_view = snapshots.decode(body)
+            writer.write(encode_ack(sequence))
+            stats.enters += len(new_view.keys() - view.keys())
+            stats.leaves += len(view.keys() - new_view.keys())
+            for pid, position in new_view.items():
+                old = view.get(pid)
+                if old is not None and old != position:
+                    updated(pid, dequantize(position[0]), now)
+            view = new_view
+
+    receiver = asyncio.create_task(receive_binary() if binary else receive_json())
+    # x counts up so every MOVE can be matched to the updates it causes; players are spread
+    # over the world's height, and wander, so areas of interest overlap and change
+    x, y = 0, rng.randint(0, spread)
+    interval = 1.0 / rate
+    await asyncio.sleep(rng.random() * interval)
+    try:
+        while not stop.is_set():
+            x += 1
+            y = max(0, min(spread, y + rng.choice((-30, 0, 30))))
+            stats.sent[(player_id, x)] = time.perf_counter()
+            if binary:
+                writer.write(encode_move(x, y))
+            else:
+                writer.write((json.dumps({"command": "MOVE", "data": {"x": x, "y": y}}) + "\n").encode())
+            await writer.drain()
+            stats.moves += 1
+            await asyncio.sleep(interval)
+    except ConnectionError:
+        pass
+    receiver.cancel()
+    writer.close()
+
+
+async def slow_client(host, port, stop):
+    # Connects and never reads, so the server's writes to it back up
+    reader, writer = await asyncio.open_connection(host, port)
+    await stop.wait()
+    writer.close()
+
+
+async def run(host, port, clients, rate, duration, slow, spread, protocol):
+    stats = Stats()
+    stop = asyncio.Event()
+    rng = random.Random(1)
+    tasks = [asyncio.create_task(slow_client(host, port, stop)) for _ in range(slow)]
+    tasks += [asyncio.create_task(simulated_client(host, port, stats, rate, spread, protocol, stop, rng)) for _ in range(clients)]
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return stats
+
+
+def report(stats, clients, duration):
+    print(f"clients {clients}, {duration:.0f}s")
+    print(f"MOVE sent         {stats.moves:>10} ({stats.moves / duration:.0f}/s)")
+    print(f"packets received  {stats.packets:>10} ({stats.packets / duration:.0f}/s)")
+    print(f"updates received  {stats.updates:>10} ({stats.updates / duration:.0f}/s)")
+    print(f"bytes received    {stats.bytes:>10} ({stats.bytes / duration / max(1, clients):.0f} per client per second)")
+    print(f"enter / leave     {stats.enters:>10} / {stats.leaves}")
+    print(f"disconnected      {stats.disconnected:>10}")
+    if stats.latencies:
+        latencies = sorted(stats.latencies)
+        for percentile in (50, 95, 99):
+            value = latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)]
+            print(f"latency p{percentile:<2}       {value * 1000:>10.1f} ms")
+        print(f"latency mean      {statistics.mean(latencies) * 1000:>10.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated clients against the game server")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=LOAD_TEST_PORT)
+    parser.add_argument("--clients", type=int, default=CLIENTS)
+    parser.add_argument("--rate", type=float, default=MOVE_RATE)
+    parser.add_argument("--duration", type=float, default=DURATION)
+    parser.add_argument("--slow", type=int, default=SLOW_CLIENTS)
+    parser.add_argument("--spread", type=int, default=SPREAD, help="pixels the players are spread over")
+    parser.add_argument("--protocol", choices=(PROTOCOL_NAME, "json"), default=PROTOCOL_NAME)
+    parser.add_argument("--spawn", action="store_true", help="start server.py on --port for the duration of the test")
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn:
+        server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"),
+                                   "--host", args.host, "--port", str(args.port)])
+        time.sleep(1.0)
+    try:
+        stats = asyncio.run(run(args.host, args.port, args.clients, args.rate, args.duration, args.slow,
+                                   args.spread, args.protocol))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    report(stats, args.clients, args.duration)
+
+
+if __name__ == "__main__":
+    main()
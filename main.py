@@ -3,9 +3,14 @@ import sys
 import random
 import json
 import os
-from worldGenerator import PerlinNoise
-from Pathfinding import Pathfinder
-from Lighting import Light, Wall, render_lightmap
+from collections import deque
+from worldGenerator import PerlinNoise, ChunkStore, TILE_COLOURS, TILE_PASSABLE, TILE_CASTS_SHADOW
+from Pathfinding import WalkabilityGrid
+from IncrementalPathfinding import IncrementalPlanner
+from PathService import PathService, HIERARCHICAL_DISTANCE
+from Rendering import TerrainRenderer, ScrollingTerrainRenderer
+from Lighting import Light, WallCache, LightmapCache, render_visibility_lightmap
+from Profiler import Profiler
 
 pygame.init()
 
@@ -16,16 +21,13 @@ WORLD_HEIGHT = 1000
 TILE_SIZE = 32
 FPS = 60
 SAVE_FILE = "savegame.json"
+PROFILE_FILE = "profile"  # P toggles the profiler overlay, O writes profile.csv and profile.json
+REPATH_INTERVAL = 500  # Milliseconds between routine repaths of a follower
+REPATH_BUDGET = 1  # Path searches allowed per frame across all followers
 
 WHITE = (255, 255, 255)
 BLUE = (0, 100, 255)
 RED = (255, 0, 0)
-GREEN = (0, 255, 0)
-DARK_GREEN = (0, 150, 0)
-BROWN = (139, 69, 19)
-GRAY = (128, 128, 128)
-LIGHT_BLUE = (173, 216, 230)
-SANDY = (238, 203, 173)
 BLACK = (0, 0, 0)
 
 
@@ -55,47 +57,37 @@ class World:
         self.height = height
         self.seed = seed or random.randint(1, 1000000)
         self.perlin = PerlinNoise(self.seed)
-        self.tile_map = self.generate_world()
-
-    def generate_world(self):
-        elevation_map = self.perlin.generate_noise_map(self.width, self.height, 20.0)
-        moisture_map = self.perlin.generate_noise_map(self.width, self.height, 15.0)
-        tile_map = []
-        for y in range(self.height):
-            row = []
-            for x in range(self.width):
-                elevation = elevation_map[y][x]
-                moisture = moisture_map[y][x]
-                if elevation < 0.3:
-                    tile_type = 'water'
-                elif elevation < 0.4:
-                    tile_type = 'sand'
-                elif elevation < 0.7:
-                    if moisture > 0.6:
-                        tile_type = 'forest'
-                    elif moisture > 0.3:
-                        tile_type = 'grass'
-                    else:
-                        tile_type = 'dirt'
-                else:
-                    tile_type = 'mountain'
-                row.append(tile_type)
-            tile_map.append(row)
-        return tile_map
+        self.chunks = ChunkStore(self.perlin)
+        # Shared by every search on the game loop; cells are filled in as searches reach them
+        self.walkability = WalkabilityGrid(width, height, self.is_walkable)
+        # Long searches run on a background thread with its own copy of the grid
+        self.paths = PathService(width, height, self.is_walkable)
+        self.walls = WallCache(self.chunks, width, height, TILE_SIZE)
+        self.lightmaps = LightmapCache(self.walls)
+        self.terrain = ScrollingTerrainRenderer(TerrainRenderer(self.chunks, width, height, TILE_SIZE))
+        # Called with (x, y) whenever set_tile changes a tile
+        self.tile_listeners = [self.walkability.invalidate, self.paths.tile_changed, self.walls.invalidate,
+                               self.lightmaps.invalidate, self.terrain.tile_changed]
+
+    def get_tile(self, x, y):
+        return self.chunks.get_tile(x, y)
+
+    def set_tile(self, x, y, tile_type):
+        self.chunks.set_tile(x, y, tile_type)
+        for listener in self.tile_listeners:
+            listener(x, y)
 
     def get_tile_color(self, tile_type):
-        colors = {
-            'water': LIGHT_BLUE,
-            'sand': SANDY,
-            'grass': GREEN,
-            'forest': DARK_GREEN,
-            'dirt': BROWN,
-            'mountain': GRAY
-        }
-        return colors.get(tile_type, WHITE)
+        return TILE_COLOURS[tile_type]
 
     def is_passable(self, tile_type):
-        return tile_type not in ['mountain']
+        return TILE_PASSABLE[tile_type]
+
+    def casts_shadow(self, tile_type):
+        return TILE_CASTS_SHADOW[tile_type]
+
+    def is_walkable(self, x, y):
+        return self.is_passable(self.get_tile(x, y))
 
 
 class Camera:
@@ -137,7 +129,7 @@ class Player:
             tile_x = cx // TILE_SIZE
             tile_y = cy // TILE_SIZE
             if 0 <= tile_x < WORLD_WIDTH and 0 <= tile_y < WORLD_HEIGHT:
-                if not self.world.is_passable(self.world.tile_map[tile_y][tile_x]):
+                if not self.world.is_passable(self.world.get_tile(tile_x, tile_y)):
                     return False
         return True
 
@@ -166,19 +158,60 @@ class Follower:
         self.world = world
         self.path = []
         self.target_index = 0
+        self.path_request = None  # Future from world.paths for a far target, until it is picked up
+        self.given_up = None  # (start, end) the planner last ran out of expansions on
+        # Keeps its search between repaths so a target that moved a tile only costs a repair
+        self.planner = IncrementalPlanner(world.walkability)
+        world.tile_listeners.append(self.planner.tile_changed)
 
     def update_path(self, target_x, target_y):
-        grid = [[0 if self.world.is_passable(self.world.tile_map[y][x]) else 1
-                 for x in range(self.world.width)]
-                for y in range(self.world.height)]
-        pathfinder = Pathfinder(grid)
         start = (int(self.x) // TILE_SIZE, int(self.y) // TILE_SIZE)
         end = (int(target_x) // TILE_SIZE, int(target_y) // TILE_SIZE)
-        new_path = pathfinder.find_path(start, end)
+        if max(abs(start[0] - end[0]), abs(start[1] - end[1])) > HIERARCHICAL_DISTANCE:
+            # Too long to run between frames; poll_path picks the result up when it is ready
+            if self.path_request is None:
+                self.path_request = self.world.paths.submit(start, end)
+            return
+        if (start, end) == self.given_up:
+            # Probably unreachable; the worker finishes the search instead of the render thread
+            if self.path_request is None:
+                self.path_request = self.world.paths.submit(start, end)
+            return
+        new_path = self.planner.find_path(start, end)
+        if self.planner.exhausted:
+            self.given_up = (start, end)
+            self.path_request = self.world.paths.submit(start, end)
+            return
         if new_path:
+            self.path_request = None
             self.path = new_path
             self.target_index = 0
 
+    def path_valid(self, target_x, target_y):
+        # The remaining path still ends on the target's tile and nothing on it has been blocked
+        end = (int(target_x) // TILE_SIZE, int(target_y) // TILE_SIZE)
+        if not self.path or self.path[-1] != end:
+            return False
+        is_walkable = self.world.walkability.is_walkable
+        return all(is_walkable(x, y) for x, y in self.path[self.target_index:])
+
+    def poll_path(self):
+        if self.path_request is None or not self.path_request.done():
+            return
+        request, self.path_request = self.path_request, None
+        if request.cancelled():
+            return
+        if request.exception() is not None:
+            # Keep the current path; the scheduler asks again on the next repath
+            print("Path search failed:", repr(request.exception()))
+            return
+        new_path = request.result()
+        if new_path:
+            # The follower kept moving while the search ran; carry on from where it is now
+            current = (int(self.x) // TILE_SIZE, int(self.y) // TILE_SIZE)
+            self.path = new_path
+            self.target_index = new_path.index(current) if current in new_path else 0
+
     def move_along_path(self):
         if not self.path or self.target_index >= len(self.path):
             return
@@ -188,10 +221,14 @@ class Follower:
         dx = target_px - self.x
         dy = target_py - self.y
         dist = max(1, (dx ** 2 + dy ** 2) ** 0.5)
-        self.x += self.speed * dx / dist
-        self.y += self.speed * dy / dist
-        if abs(dx) < 2 and abs(dy) < 2:
+        if dist <= self.speed:
+            # Land on the tile centre rather than overshooting and oscillating around it
+            self.x = target_px
+            self.y = target_py
             self.target_index += 1
+        else:
+            self.x += self.speed * dx / dist
+            self.y += self.speed * dy / dist
 
     def draw(self, screen, camera):
         screen_x = self.x - camera.x
@@ -199,18 +236,44 @@ class Follower:
         pygame.draw.rect(screen, self.color, (screen_x, screen_y, self.width, self.height))
 
 
+class RepathScheduler:
+    # Decides which followers search each frame: each is due on a fixed interval, or as soon as its
+    # target changes tile and its path no longer leads there. Due followers wait in a queue and at
+    # most `budget` of them search per frame.
+    def __init__(self, interval=REPATH_INTERVAL, budget=REPATH_BUDGET):
+        self.interval = interval
+        self.budget = budget
+        self.entries = {}  # Follower -> [target, last repath time, target tile at last repath]
+        self.queue = deque()
+
+    def add(self, follower, target):
+        self.entries[follower] = [target, None, None]
+
+    def remove(self, follower):
+        self.entries.pop(follower, None)
+        if follower in self.queue:
+            self.queue.remove(follower)
+
+    def update(self, now):
+        for follower, (target, last_time, last_tile) in self.entries.items():
+            if follower in self.queue:
+                continue
+            tile = (int(target.x) // TILE_SIZE, int(target.y) // TILE_SIZE)
+            if (last_time is None or now - last_time >= self.interval or
+                    (tile != last_tile and not follower.path_valid(target.x, target.y))):
+                self.queue.append(follower)
+
+        for _ in range(min(self.budget, len(self.queue))):
+            follower = self.queue.popleft()
+            entry = self.entries[follower]
+            target = entry[0]
+            follower.update_path(target.x, target.y)
+            entry[1] = now
+            entry[2] = (int(target.x) // TILE_SIZE, int(target.y) // TILE_SIZE)
+
+
 def draw_world(screen, world, camera):
-    start_x = max(0, camera.x // TILE_SIZE)
-    end_x = min(world.width, (camera.x + camera.width) // TILE_SIZE + 1)
-    start_y = max(0, camera.y // TILE_SIZE)
-    end_y = min(world.height, (camera.y + camera.height) // TILE_SIZE + 1)
-    for y in range(start_y, end_y):
-        for x in range(start_x, end_x):
-            tile_type = world.tile_map[y][x]
-            color = world.get_tile_color(tile_type)
-            screen_x = x * TILE_SIZE - camera.x
-            screen_y = y * TILE_SIZE - camera.y
-            pygame.draw.rect(screen, color, (screen_x, screen_y, TILE_SIZE, TILE_SIZE))
+    world.terrain.draw(screen, camera.x, camera.y)
 
 
 def main():
@@ -225,6 +288,11 @@ def main():
     player = Player(start_x, start_y, world)
     follower = Follower(start_x + 50, start_y + 50, world)
     camera = Camera(SCREEN_WIDTH, SCREEN_HEIGHT)
+    scheduler = RepathScheduler()
+    scheduler.add(follower, player)
+    visibility_lighting = False  # V toggles between sampled shadows and visibility polygons
+    profiler = Profiler()
+    profile_font = pygame.font.SysFont("consolas,couriernew,monospace", 16)
 
     running = True
     while running:
@@ -234,15 +302,26 @@ def main():
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_k:
                     save_game(player, follower, world_seed)
+                elif event.key == pygame.K_v:
+                    visibility_lighting = not visibility_lighting
+                elif event.key == pygame.K_p:
+                    profiler.toggle()
+                elif event.key == pygame.K_o:
+                    profiler.export_csv(PROFILE_FILE + ".csv")
+                    profiler.export_json(PROFILE_FILE + ".json")
+                    print("Profile saved!")
                 elif event.key == pygame.K_l:
                     data = load_game()
                     if data:
                         world_seed = data["seed"]
+                        world.paths.shutdown()
                         world = World(WORLD_WIDTH, WORLD_HEIGHT, world_seed)
+                        player.world = world
                         player.x = data["player"]["x"]
                         player.y = data["player"]["y"]
-                        follower.x = data["follower"]["x"]
-                        follower.y = data["follower"]["y"]
+                        scheduler.remove(follower)
+                        follower = Follower(data["follower"]["x"], data["follower"]["y"], world)
+                        scheduler.add(follower, player)
 
         # Player movement
         keys = pygame.key.get_pressed()
@@ -255,51 +334,56 @@ def main():
         camera.update(player.x + player.width // 2, player.y + player.height // 2)
 
         # Follower path & movement
-        if pygame.time.get_ticks() % 30 == 0:
-            follower.update_path(player.x, player.y)
-        follower.move_along_path()
+        with profiler.scope("pathfinding"):
+            scheduler.update(pygame.time.get_ticks())
+            follower.poll_path()
+            follower.move_along_path()
 
         # Draw world & characters
-        screen.fill(BLACK)
-        draw_world(screen, world, camera)
-        player.draw(screen, camera)
-        follower.draw(screen, camera)
-
-        walls = []
-        margin = 2
-        start_x = max(0, camera.x // TILE_SIZE - margin)
-        end_x = min(world.width, (camera.x + camera.width) // TILE_SIZE + 1 + margin)
-        start_y = max(0, camera.y // TILE_SIZE - margin)
-        end_y = min(world.height, (camera.y + camera.height) // TILE_SIZE + 1 + margin)
-
-        for y in range(start_y, end_y):
-            for x in range(start_x, end_x):
-                tile_type = world.tile_map[y][x]
-                if tile_type in ['mountain', 'forest']:
-                    wx = x * TILE_SIZE - camera.x
-                    wy = y * TILE_SIZE - camera.y
-                    walls.append(Wall(wx, wy, wx + TILE_SIZE, wy))
-                    walls.append(Wall(wx + TILE_SIZE, wy, wx + TILE_SIZE, wy + TILE_SIZE))
-                    walls.append(Wall(wx + TILE_SIZE, wy + TILE_SIZE, wx, wy + TILE_SIZE))
-                    walls.append(Wall(wx, wy + TILE_SIZE, wx, wy))
+        with profiler.scope("draw_world"):
+            screen.fill(BLACK)
+            draw_world(screen, world, camera)
+            player.draw(screen, camera)
+            follower.draw(screen, camera)
 
         # Lights (player, follower, mouse)
         lights = [
             Light(follower.x - camera.x, follower.y - camera.y, 120, (50, 50, 255))
         ]
 
-        render_lightmap(screen, lights, walls, step=20)
+        if visibility_lighting:
+            margin = 2
+            start_x = max(0, camera.x // TILE_SIZE - margin)
+            end_x = min(world.width, (camera.x + camera.width) // TILE_SIZE + 1 + margin)
+            start_y = max(0, camera.y // TILE_SIZE - margin)
+            end_y = min(world.height, (camera.y + camera.height) // TILE_SIZE + 1 + margin)
+            with profiler.scope("walls"):
+                walls = world.walls.get_walls(start_x, start_y, end_x, end_y, camera.x, camera.y, lights)
+            with profiler.scope("lighting"):
+                render_visibility_lightmap(screen, lights, walls)
+        else:
+            with profiler.scope("walls"):
+                world.lightmaps.fetch_walls(lights, camera.x, camera.y)
+            with profiler.scope("lighting"):
+                world.lightmaps.render(screen, lights, camera.x, camera.y)
 
         # Instructions
         font = pygame.font.Font(None, 24)
-        instructions = ["Arrow Keys/WASD to move", "K: Save | L: Load"]
+        instructions = ["Arrow Keys/WASD to move", "K: Save | L: Load", "V: Toggle shadow mode",
+                        "P: Profiler | O: Export profile"]
         for i, text in enumerate(instructions):
             rendered_text = font.render(text, True, WHITE)
             screen.blit(rendered_text, (10, 10 + i * 25))
+        if profiler.enabled:
+            profiler.draw(screen, profile_font, 10, 10 + len(instructions) * 25 + 10)
 
-        pygame.display.flip()
+        with profiler.scope("present"):
+            pygame.display.flip()
         clock.tick(FPS)
+        # Time the frame took before the tick's wait
+        profiler.record("frame", clock.get_rawtime())
 
+    world.paths.shutdown()
     pygame.quit()
     sys.exit()
 
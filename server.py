@@ -1,88 +1,248 @@
 import json
-import socket
-import threading
+import math
+import time
 import random
+import asyncio
+import argparse
+from InterestManagement import InterestGrid, INTEREST_RADIUS
+from Protocol import (PROTOCOL_NAME, PROTOCOL_VERSION, MOVE, ACK, SnapshotEncoder, read_frame, quantize,
+                      decode_move, decode_ack)
 
 HOST = '127.0.0.1'
 PORT = 50000
-
-clients = []
-players = {}  # player_id -> position
-world_seed = random.randint(1, 1000000)  # generate world once
+WRITE_QUEUE_SIZE = 256  # Packets a client may fall behind by before it is disconnected
+TICK_RATE = 20  # Snapshots broadcast per second
 
 start_positions = [(200, 200), (500, 500)]  # adjust for more players
 
 
-def send_packet(conn, packet):
-    try:
-        conn.send((json.dumps(packet) + "\n").encode())
-    except:
-        if conn in clients:
-            clients.remove(conn)
-
+def encode(packet):
+    return (json.dumps(packet) + "\n").encode()
 
-def broadcast(packet, skip_conn=None):
-    for c in list(clients):
-        if c != skip_conn:
-            send_packet(c, packet)
 
+class Client:
+    # One connection. Packets are queued and written by the client's own task, so a slow reader
+    # only ever blocks itself
+    def __init__(self, player_id, writer, queue_size=WRITE_QUEUE_SIZE):
+        self.player_id = player_id
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=queue_size)  # Encoded lines; None asks the writer to stop
+        self.visible = set()  # Other players this client has been told about with ENTER
+        self.snapshots = None  # SnapshotEncoder once the client has switched to the binary protocol
+        self.closed = False
 
-def handle_client(conn, player_id):
-    buffer = ""
-    while True:
+    def send(self, data):
+        # Never blocks. A client whose queue is full is too far behind to catch up, so drop it
+        # rather than let memory grow or stall the sender
+        if self.closed:
+            return
         try:
-            data = conn.recv(4096).decode()
-            if not data:
-                break
-            buffer += data
-            while "\n" in buffer:
-                line, buffer = buffer.split("\n", 1)
-                if not line.strip():
-                    continue
-                packet = json.loads(line)
-                if packet["command"] == "MOVE":
-                    players[player_id] = packet["data"]
-                    # broadcast updated position to others
-                    broadcast({"command": "UPDATE_POS", "data": {player_id: packet["data"]}}, skip_conn=conn)
-        except Exception as e:
-            print(f"Client {player_id} disconnected: {e}")
-            break
-
-    # cleanup after disconnect
-    if conn in clients:
-        clients.remove(conn)
-    if player_id in players:
-        del players[player_id]
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            print(f"Client {self.player_id} disconnected: write queue full")
+            self.close()
 
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.transport.abort()
 
-def main():
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.bind((HOST, PORT))
-    s.listen()
-    print(f"Server listening on {HOST}:{PORT}, World Seed: {world_seed}")
-
-    player_count = 0
-    while True:
-        conn, addr = s.accept()
-        player_count += 1
-        player_id = player_count
-        clients.append(conn)
+    async def write_loop(self):
+        try:
+            while True:
+                data = await self.queue.get()
+                if data is None:
+                    break
+                self.writer.write(data)
+                # Waits only while this client's socket buffer is full
+                await self.writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.close()
+
+
+class GameServer:
+    def __init__(self, world_seed=None, queue_size=WRITE_QUEUE_SIZE, tick_rate=TICK_RATE,
+                 interest_radius=INTEREST_RADIUS):
+        self.world_seed = world_seed or random.randint(1, 1000000)  # generate world once
+        self.queue_size = queue_size
+        self.tick_rate = tick_rate
+        self.interest_radius = interest_radius
+        self.interest = InterestGrid(interest_radius)
+        self.clients = {}  # player_id -> Client
+        self.players = {}  # player_id -> position
+        self.moved = set()  # Players whose position changed since the last tick
+        self.player_count = 0
+
+    def move(self, player_id, position):
+        # Only the latest position is kept; it goes out with the next tick's snapshot. It is
+        # checked first, since it is passed on to other clients and placed in the interest grid
+        if not isinstance(position, dict):
+            raise ValueError(f"MOVE data is not an object: {position!r}")
+        x, y = position.get("x"), position.get("y")
+        for value in (x, y):
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise ValueError(f"MOVE position is not two finite numbers: {position!r}")
+        self.interest.update(player_id, float(x), float(y))
+        self.players[player_id] = {"x": x, "y": y}
+        self.moved.add(player_id)
+
+    def handle_packet(self, client, packet):
+        if packet["command"] == "MOVE":
+            self.move(client.player_id, packet["data"])
+        elif packet["command"] == "PROTOCOL":
+            # Sent once after SETUP. The reply is the last JSON line; after it both sides use binary frames
+            data = packet["data"]
+            if data.get("name") == PROTOCOL_NAME and data.get("version") == PROTOCOL_VERSION:
+                client.send(encode({"command": "PROTOCOL", "data": {"name": PROTOCOL_NAME, "version": PROTOCOL_VERSION}}))
+                client.snapshots = SnapshotEncoder()
+            else:
+                client.send(encode({"command": "PROTOCOL", "data": {"name": "json"}}))
+
+    def handle_frame(self, client, kind, body):
+        if kind == MOVE:
+            self.move(client.player_id, decode_move(body))
+        elif kind == ACK:
+            client.snapshots.acknowledge(decode_ack(body))
+
+    def tick(self):
+        # Each client hears only about players within interest_radius of it. JSON clients get LEAVE
+        # for those that dropped out of range or disconnected, ENTER with the position of those that
+        # came into range, and one UPDATE_POS for the rest that moved, however many MOVEs they sent.
+        # Binary clients get one SNAPSHOT of everything in range, as a delta that covers all three.
+        moved, self.moved = self.moved, set()
+        positions = self.interest.positions
+        for player_id, client in list(self.clients.items()):
+            try:
+                x, y = positions[player_id]
+                visible = self.interest.query(x, y, self.interest_radius)
+                visible.discard(player_id)
+                if client.snapshots is not None:
+                    client.visible = visible
+                    data = client.snapshots.encode({other: (quantize(positions[other][0]),
+                                                            quantize(positions[other][1]))
+                                                    for other in visible})
+                    if data:
+                        client.send(data)
+                    continue
+                entered = visible - client.visible
+                left = client.visible - visible
+                updated = (visible & moved) - entered
+                client.visible = visible
+                if left:
+                    client.send(encode({"command": "LEAVE", "data": sorted(left)}))
+                if entered:
+                    client.send(encode({"command": "ENTER", "data": {other: self.players[other] for other in entered}}))
+                if updated:
+                    client.send(encode({"command": "UPDATE_POS",
+                                        "data": {other: self.players[other] for other in updated}}))
+            except Exception as e:
+                # A client whose update cannot be built is dropped; the others still get theirs
+                print(f"Client {player_id} disconnected: tick failed: {e!r}")
+                client.close()
+
+    async def tick_loop(self):
+        interval = 1.0 / self.tick_rate
+        next_tick = time.monotonic()
+        while True:
+            self.tick()
+            next_tick += interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # Fell behind; skip the missed ticks rather than running them back to back
+                next_tick -= delay
+                delay = 0
+            await asyncio.sleep(delay)
+
+    def join(self, client):
+        # Returns the new player's start position
+        player_id = client.player_id
+        self.clients[player_id] = client
         px, py = start_positions[(player_id - 1) % len(start_positions)]
-        players[player_id] = {"x": px, "y": py}
+        self.players[player_id] = {"x": px, "y": py}
+        self.interest.update(player_id, px, py)
+        return px, py
+
+    def leave(self, player_id):
+        # Clients that could see the player get LEAVE on the next tick
+        self.clients.pop(player_id, None)
+        self.players.pop(player_id, None)
+        self.interest.remove(player_id)
+        self.moved.discard(player_id)
+
+    async def handle_client(self, reader, writer):
+        self.player_count += 1
+        player_id = self.player_count
+        client = Client(player_id, writer, self.queue_size)
+        px, py = self.join(client)
 
         # Send setup info
-        setup_packet = {
+        client.send(encode({
             "command": "SETUP",
             "data": {
                 "PlayerID": player_id,
                 "PlayerX": px,
                 "PlayerY": py,
-                "WorldSeed": world_seed
+                "WorldSeed": self.world_seed,
+                "Protocols": [{"name": PROTOCOL_NAME, "version": PROTOCOL_VERSION}, {"name": "json"}]
             }
-        }
-        send_packet(conn, setup_packet)
+        }))
+        write_task = asyncio.create_task(client.write_loop())
 
-        threading.Thread(target=handle_client, args=(conn, player_id), daemon=True).start()
+        try:
+            while not client.closed:
+                if client.snapshots is not None:
+                    kind, body = await read_frame(reader)
+                    self.handle_frame(client, kind, body)
+                    continue
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                self.handle_packet(client, json.loads(line))
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception as e:
+            # Anything a client sends that cannot be handled ends that client, never the server
+            print(f"Client {player_id} disconnected: {e!r}")
+        finally:
+            # cleanup after disconnect
+            self.leave(player_id)
+            try:
+                # Let the writer flush what is already queued, then close
+                client.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                client.close()
+            if client.closed:
+                write_task.cancel()
+            await asyncio.gather(write_task, return_exceptions=True)
+            writer.close()
+
+    async def serve(self, host=HOST, port=PORT):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"Server listening on {host}:{port}, World Seed: {self.world_seed}")
+        ticker = asyncio.create_task(self.tick_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            ticker.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Game server")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--tick-rate", type=float, default=TICK_RATE)
+    parser.add_argument("--radius", type=float, default=INTEREST_RADIUS, help="area of interest radius in pixels")
+    args = parser.parse_args()
+    server = GameServer(tick_rate=args.tick_rate, interest_radius=args.radius)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
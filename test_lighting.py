@@ -0,0 +1,136 @@
+import os
+import math
+import random
+import pytest
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+from worldGenerator import PerlinNoise, ChunkStore, TILE_TYPES, TILE_CASTS_SHADOW
+from Lighting import Light, Wall, WallCache, WallGrid, LightmapCache, CachedLight, AMBIENT, is_in_shadow, render_lightmap
+
+pygame.init()
+
+
+def reference_lightmap(screen, lights, walls, step):
+    # The original per-sample loop that render_lightmap replaced
+    width, height = screen.get_size()
+    light_surface = pygame.Surface((width // step, height // step))
+    for x in range(0, width, step):
+        for y in range(0, height, step):
+            total = list(AMBIENT)
+            for light in lights:
+                dist_sq = (x - light.x) ** 2 + (y - light.y) ** 2
+                if dist_sq < light.radius ** 2 and not is_in_shadow(light.x, light.y, x, y, walls):
+                    falloff = 1.0 - (math.sqrt(dist_sq) / light.radius)
+                    intensity = falloff * falloff * 0.6
+                    total = [min(255, level + channel * intensity) for level, channel in zip(total, light.colour)]
+            light_surface.set_at((x // step, y // step), [int(level) for level in total])
+    scaled = pygame.transform.scale(light_surface, (width, height))
+    screen.blit(scaled, (0, 0), special_flags=pygame.BLEND_MULT)
+
+
+def random_scene(rng, width, height):
+    # Tile-sized boxes, some off screen, and lights anywhere including exactly on a sample
+    walls = []
+    for _ in range(rng.randint(0, 20)):
+        x, y = rng.randint(-40, width + 8), rng.randint(-40, height + 8)
+        walls += [Wall(x, y, x + 32, y), Wall(x + 32, y, x + 32, y + 32),
+                  Wall(x + 32, y + 32, x, y + 32), Wall(x, y + 32, x, y)]
+    lights = [Light(rng.uniform(0, width), rng.uniform(0, height), rng.choice([40, 80.5, 150]),
+                    (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+              for _ in range(rng.randint(0, 3))]
+    if rng.random() < 0.3:
+        lights.append(Light(float(rng.randrange(0, width, 12)), float(rng.randrange(0, height, 12)), 100))
+    return lights, walls
+
+
+def lit_screen(render, size, lights, walls, step):
+    screen = pygame.Surface(size)
+    screen.fill((255, 255, 255))
+    render(screen, lights, walls, step)
+    return pygame.image.tostring(screen, "RGB")
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_render_lightmap_matches_reference(seed):
+    rng = random.Random(seed)
+    size = rng.choice([(240, 180), (233, 181)])
+    step = rng.choice([5, 12, 20])
+    lights, walls = random_scene(rng, *size)
+    assert (lit_screen(render_lightmap, size, lights, walls, step) ==
+            lit_screen(reference_lightmap, size, lights, walls, step))
+
+
+def random_world(rng, chunk_size=8):
+    # A few chunks of random tiles, smaller than the chunks covering it so the world edge cuts through one
+    width, height = rng.randint(5, 30), rng.randint(5, 30)
+    chunks = ChunkStore(PerlinNoise(rng.randrange(1000)), chunk_size)
+    density = rng.random() * 0.6
+    for y in range(height):
+        for x in range(width):
+            shadow = rng.random() < density
+            chunks.set_tile(x, y, rng.choice([tile for tile in range(len(TILE_TYPES)) if TILE_CASTS_SHADOW[tile] == shadow]))
+    return chunks, width, height
+
+
+def tile_walls(chunks, width, height, tile):
+    # Four edges for every shadow-casting tile, as the game built them before WallCache
+    walls = []
+    for y in range(height):
+        for x in range(width):
+            if TILE_CASTS_SHADOW[chunks.get_tile(x, y)]:
+                wx, wy = x * tile, y * tile
+                walls += [Wall(wx, wy, wx + tile, wy), Wall(wx + tile, wy, wx + tile, wy + tile),
+                          Wall(wx + tile, wy + tile, wx, wy + tile), Wall(wx, wy + tile, wx, wy)]
+    return walls
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_wall_cache_matches_tile_walls(seed):
+    # Merged outlines must shadow exactly what the per-tile edges did, lights on casters included
+    rng = random.Random(seed)
+    tile = rng.choice([8, 16])
+    chunks, width, height = random_world(rng)
+    size = (width * tile, height * tile)
+    lights = [Light(rng.uniform(0, size[0]), rng.uniform(0, size[1]), rng.choice([30, 60.5, 120]),
+                    (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+              for _ in range(rng.randint(1, 3))]
+    camera_x, camera_y = rng.randint(0, tile), rng.randint(0, tile)
+    screen_lights = [Light(light.x - camera_x, light.y - camera_y, light.radius, light.colour) for light in lights]
+    merged = WallCache(chunks, width, height, tile).get_walls(0, 0, width, height, camera_x, camera_y, screen_lights)
+    edges = [Wall(wall.x1 - camera_x, wall.y1 - camera_y, wall.x2 - camera_x, wall.y2 - camera_y)
+             for wall in tile_walls(chunks, width, height, tile)]
+    step = rng.choice([3, 4, 7])
+    assert (lit_screen(render_lightmap, size, screen_lights, merged, step) ==
+            lit_screen(render_lightmap, size, screen_lights, edges, step))
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_lightmap_cache_matches_rebuilt_lights(seed):
+    # After tile edits, each cached light's samples (only the dirty ones recomputed) must equal a
+    # light built from scratch over the new walls
+    rng = random.Random(seed)
+    tile = 8
+    chunks, width, height = random_world(rng)
+    walls = WallCache(chunks, width, height, tile)
+    cache = LightmapCache(walls, step=rng.choice([3, 5]))
+    lights = [(rng.uniform(0, width * tile), rng.uniform(0, height * tile), rng.choice([30, 60.5]),
+               (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+              for _ in range(rng.randint(1, 4))]
+    for _ in range(6):
+        if rng.random() < 0.5:
+            # Walls fetched ahead, as the game does so it can time them on their own
+            cache.fetch_walls([Light(*light) for light in lights], 0, 0)
+        for light in lights:
+            cache.get_light(*light)
+        for _ in range(rng.randint(1, 5)):
+            x, y = rng.randrange(width), rng.randrange(height)
+            chunks.set_tile(x, y, rng.randrange(len(TILE_TYPES)))
+            walls.invalidate(x, y)
+            cache.invalidate(x, y)
+    for light in lights:
+        cached = cache.get_light(*light)
+        fresh = CachedLight(Light(cached.light.x, cached.light.y, cached.light.radius, cached.light.colour), cache.step)
+        fresh.update(WallGrid(walls.get_walls(0, 0, width, height, 0, 0, [fresh.light])))
+        assert np.array_equal(cached.pixels, fresh.pixels)
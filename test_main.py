@@ -0,0 +1,102 @@
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+from main import RepathScheduler, TILE_SIZE
+
+
+class StubTarget:
+    def __init__(self, tile_x, tile_y):
+        self.move_to(tile_x, tile_y)
+
+    def move_to(self, tile_x, tile_y, within=0):
+        self.x, self.y = tile_x * TILE_SIZE + within, tile_y * TILE_SIZE + within
+
+
+class StubFollower:
+    def __init__(self, name, log):
+        self.name = name
+        self.log = log  # Shared list of (name, target tile) for every update_path call, in order
+        self.valid = True
+
+    def update_path(self, target_x, target_y):
+        self.log.append((self.name, (int(target_x) // TILE_SIZE, int(target_y) // TILE_SIZE)))
+
+    def path_valid(self, target_x, target_y):
+        return self.valid
+
+
+def make_scheduler(count, interval=500, budget=1):
+    log = []
+    scheduler = RepathScheduler(interval, budget)
+    followers = [StubFollower(name, log) for name in "abcdefgh"[:count]]
+    targets = [StubTarget(10, 10) for _ in followers]
+    for follower, target in zip(followers, targets):
+        scheduler.add(follower, target)
+    return scheduler, followers, targets, log
+
+
+def test_repaths_on_the_interval():
+    scheduler, _, _, log = make_scheduler(2, budget=2)
+    scheduler.update(0)
+    assert [name for name, _ in log] == ["a", "b"]
+    for now in (1, 250, 499):
+        scheduler.update(now)
+    assert len(log) == 2
+    scheduler.update(500)
+    assert [name for name, _ in log] == ["a", "b", "a", "b"]
+    scheduler.update(999)
+    assert len(log) == 4
+    scheduler.update(1000)
+    assert len(log) == 6
+
+
+def test_repaths_early_when_target_tile_changes_and_path_is_invalid():
+    scheduler, (a,), (target,), log = make_scheduler(1)
+    scheduler.update(0)
+    log.clear()
+    # New tile, but the current path still leads there
+    target.move_to(11, 10)
+    scheduler.update(100)
+    assert log == []
+    # Path broken, but the target has not left its tile since the last repath
+    a.valid = False
+    target.move_to(10, 10, within=TILE_SIZE - 1)
+    scheduler.update(150)
+    assert log == []
+    # New tile and the path no longer leads there
+    target.move_to(12, 10)
+    scheduler.update(200)
+    assert log == [("a", (12, 10))]
+    # The tile is remembered, so it does not repath again until the next change or interval
+    scheduler.update(300)
+    assert log == [("a", (12, 10))]
+    scheduler.update(700)
+    assert log == [("a", (12, 10)), ("a", (12, 10))]
+
+
+def test_due_followers_queue_in_order_within_the_budget():
+    scheduler, followers, _, log = make_scheduler(4, budget=1)
+    for now in range(6):
+        scheduler.update(now)
+    assert [name for name, _ in log] == ["a", "b", "c", "d"]
+    assert not scheduler.queue
+
+    scheduler.budget = 2
+    log.clear()
+    # Everyone is due again; they are served in order, at most two per frame, and nobody is queued twice
+    scheduler.update(503)
+    assert [name for name, _ in log] == ["a", "b"]
+    assert [follower.name for follower in scheduler.queue] == ["c", "d"]
+    scheduler.update(504)
+    assert [name for name, _ in log] == ["a", "b", "c", "d"]
+    scheduler.update(505)
+    assert len(log) == 4 and not scheduler.queue
+
+
+def test_removed_followers_leave_the_queue():
+    scheduler, (a, b, c), _, log = make_scheduler(3, budget=1)
+    scheduler.update(0)
+    scheduler.remove(b)
+    scheduler.update(1)
+    scheduler.update(2)
+    assert [name for name, _ in log] == ["a", "c"]
@@ -0,0 +1,152 @@
+import heapq
+import math
+import random
+import pytest
+from Pathfinding import Pathfinder, WalkabilityGrid, DIRECTIONS
+from HierarchicalPathfinding import HierarchicalPathfinder
+from IncrementalPathfinding import IncrementalPlanner
+
+
+def random_grid(rng, max_size=40, max_density=0.45):
+    width, height = rng.randint(1, max_size), rng.randint(1, max_size)
+    density = rng.random() * max_density
+    return [[1 if rng.random() < density else 0 for _ in range(width)] for _ in range(height)]
+
+
+def random_cell(rng, grid):
+    return rng.randrange(len(grid[0])), rng.randrange(len(grid))
+
+
+def dijkstra(grid, start, end):
+    # Reference: cost of the cheapest 8-connected path, or None when there is none
+    height, width = len(grid), len(grid[0])
+    if grid[start[1]][start[0]] or grid[end[1]][end[0]]:
+        return None
+    costs = {start: 0.0}
+    heap = [(0.0, start)]
+    while heap:
+        cost, cell = heapq.heappop(heap)
+        if cost > costs[cell]:
+            continue
+        if cell == end:
+            return cost
+        for dx, dy, step in DIRECTIONS:
+            x, y = cell[0] + dx, cell[1] + dy
+            if 0 <= x < width and 0 <= y < height and not grid[y][x]:
+                new_cost = cost + step
+                if new_cost < costs.get((x, y), math.inf):
+                    costs[(x, y)] = new_cost
+                    heapq.heappush(heap, (new_cost, (x, y)))
+    return None
+
+
+def path_cost(path):
+    return sum(math.sqrt(2) if a[0] != b[0] and a[1] != b[1] else 1.0 for a, b in zip(path, path[1:]))
+
+
+def check_path(grid, path, start, end):
+    assert path[0] == start and path[-1] == end
+    for a, b in zip(path, path[1:]):
+        assert max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1
+        assert not grid[b[1]][b[0]]
+
+
+@pytest.mark.parametrize("algorithm", ["astar", "jps"])
+@pytest.mark.parametrize("seed", range(5))
+def test_pathfinder_matches_dijkstra(seed, algorithm):
+    rng = random.Random(seed)
+    for _ in range(60):
+        grid = random_grid(rng)
+        pathfinder = Pathfinder(WalkabilityGrid.from_rows(grid))
+        for _ in range(5):
+            start, end = random_cell(rng, grid), random_cell(rng, grid)
+            path = pathfinder.find_path(start, end, algorithm)
+            expected = dijkstra(grid, start, end)
+            if expected is None:
+                assert path is None
+            else:
+                check_path(grid, path, start, end)
+                assert path_cost(path) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_hierarchical_finds_valid_paths(seed):
+    # HPA* trades optimality for speed, so only reachability and validity are exact
+    rng = random.Random(seed)
+    for _ in range(60):
+        grid = random_grid(rng)
+        walkability = WalkabilityGrid.from_rows(grid)
+        hierarchy = HierarchicalPathfinder(walkability, cluster_size=rng.randint(2, 9))
+        for _ in range(6):
+            if rng.random() < 0.3:
+                # Flip a tile; both caches must forget it
+                x, y = random_cell(rng, grid)
+                grid[y][x] ^= 1
+                walkability.invalidate(x, y)
+                hierarchy.invalidate(x, y)
+            start, end = random_cell(rng, grid), random_cell(rng, grid)
+            path = hierarchy.find_path(start, end)
+            expected = dijkstra(grid, start, end)
+            if expected is None:
+                assert path is None
+            else:
+                check_path(grid, path, start, end)
+                assert path_cost(path) >= expected - 1e-9
+
+
+def nudge(rng, cell, grid):
+    return (min(len(grid[0]) - 1, max(0, cell[0] + rng.randint(-1, 1))),
+            min(len(grid) - 1, max(0, cell[1] + rng.randint(-1, 1))))
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_incremental_planner_matches_dijkstra(seed):
+    # One planner per grid, reused while the start and goal wander and tiles flip, so the
+    # re-rooting, re-keying and repair paths all run between queries
+    rng = random.Random(seed)
+    for _ in range(30):
+        grid = random_grid(rng, max_size=30, max_density=0.4)
+        walkability = WalkabilityGrid.from_rows(grid)
+        planner = IncrementalPlanner(walkability)
+        start, end = random_cell(rng, grid), random_cell(rng, grid)
+        for _ in range(25):
+            roll = rng.random()
+            if roll < 0.3:
+                start = nudge(rng, start, grid)
+            elif roll < 0.6:
+                end = nudge(rng, end, grid)
+            elif roll < 0.85:
+                x, y = random_cell(rng, grid)
+                grid[y][x] ^= 1
+                walkability.invalidate(x, y)
+                planner.tile_changed(x, y)
+            else:
+                end = random_cell(rng, grid)
+            path = planner.find_path(start, end)
+            expected = dijkstra(grid, start, end)
+            if expected is None:
+                assert path is None
+            else:
+                check_path(grid, path, start, end)
+                assert path_cost(path) == pytest.approx(expected)
+
+
+def test_incremental_planner_gives_up_on_enclosed_goal():
+    # An unreachable goal must not make the planner flood the whole open region
+    grid = [[0] * 60 for _ in range(60)]
+    for x, y in ((39, 39), (40, 39), (41, 39), (39, 40), (41, 40), (39, 41), (40, 41), (41, 41)):
+        grid[y][x] = 1
+    walkability = WalkabilityGrid.from_rows(grid)
+    planner = IncrementalPlanner(walkability, max_expansions=500)
+    assert planner.find_path((5, 5), (40, 40)) is None
+    assert planner.exhausted and planner.expanded <= 500
+    assert len(planner.g) <= 500
+    # It starts small again and still finds reachable goals
+    assert planner.find_path((5, 5), (20, 20)) is not None
+    assert not planner.exhausted
+    grid[39][40] = 0
+    walkability.invalidate(40, 39)
+    planner.tile_changed(40, 39)
+    path = planner.find_path((5, 5), (40, 40))
+    check_path(grid, path, (5, 5), (40, 40))
+    assert path_cost(path) == pytest.approx(dijkstra(grid, (5, 5), (40, 40)))
@@ -0,0 +1,20 @@
+import time
+from Profiler import Profiler
+
+
+def test_nested_scopes_with_the_same_name():
+    profiler = Profiler(enabled=True)
+    with profiler.scope("stage"):
+        time.sleep(0.02)
+        with profiler.scope("stage"):
+            pass
+    inner, outer = profiler.scopes["stage"].samples
+    assert inner < 10 <= outer
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler()
+    with profiler.scope("stage"):
+        pass
+    profiler.record("frame", 16.0)
+    assert profiler.stats() == {}
@@ -0,0 +1,93 @@
+import random
+import asyncio
+import pytest
+from Protocol import (MOVE, ACK, SNAPSHOT, HEADER, MAX_FRAME_SIZE, SnapshotEncoder, SnapshotDecoder, frame,
+                      split_frames, read_frame, encode_move, decode_move, encode_ack, decode_ack)
+
+
+def random_view(rng, view):
+    # Players leave, arrive (some with ids past 16 bits), take small steps or jump far enough to need
+    # an absolute position
+    view = {player_id: position for player_id, position in view.items() if rng.random() > 0.1}
+    for player_id, (x, y) in view.items():
+        roll = rng.random()
+        if roll < 0.5:
+            view[player_id] = (x + rng.randint(-40, 40), y + rng.randint(-40, 40))
+        elif roll < 0.6:
+            view[player_id] = (x + rng.choice([-1, 1]) * 40000, y)
+    for _ in range(rng.randint(0, 4)):
+        view[rng.choice([rng.randint(1, 100), rng.randint(65536, 2 ** 32 - 1)])] = (
+            rng.randint(-2 ** 31, 2 ** 31 - 1), rng.randint(-2 ** 31, 2 ** 31 - 1))
+    return view
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_snapshots_round_trip_with_lagged_acks(seed):
+    # Acks arrive late, out of order or not at all, and the encoder falls back to an empty base
+    # when too many go unacknowledged; the client must always end up with the server's view
+    rng = random.Random(seed)
+    encoder = SnapshotEncoder(history=rng.randint(1, 8))
+    decoder = SnapshotDecoder()
+    view = {}
+    in_flight = []  # Sequences decoded by the client whose acks have not reached the server yet
+    for _ in range(200):
+        view = random_view(rng, view)
+        data = encoder.encode(dict(view))
+        if data is None:
+            assert view == encoder.last_view
+        else:
+            frames, rest = split_frames(data)
+            assert rest == b"" and len(frames) == 1 and frames[0][0] == SNAPSHOT
+            sequence, decoded = decoder.decode(frames[0][1])
+            assert decoded == view
+            in_flight.append(sequence)
+        rng.shuffle(in_flight)
+        while in_flight and rng.random() < 0.5:
+            sequence = in_flight.pop()
+            if rng.random() < 0.8:
+                encoder.acknowledge(decode_ack(split_frames(encode_ack(sequence))[0][0][1]))
+
+
+def test_moves_round_trip():
+    for x, y in ((0, 0), (12.25, -7.5), (-1000000, 250000.75)):
+        frames, _ = split_frames(encode_move(x, y))
+        assert len(frames) == 1 and frames[0][0] == MOVE
+        assert decode_move(frames[0][1]) == {"x": x, "y": y}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_split_frames_over_partial_buffers(seed):
+    # However the stream is cut up, the frames come out whole and in order
+    rng = random.Random(seed)
+    sent = [(rng.choice([MOVE, ACK, SNAPSHOT]), rng.randbytes(rng.choice([0, 1, 8, 300])))
+            for _ in range(50)]
+    stream = b"".join(frame(kind, body) for kind, body in sent)
+    received = []
+    buffer = b""
+    offset = 0
+    while offset < len(stream):
+        size = rng.randint(1, 40)
+        buffer += stream[offset:offset + size]
+        offset += size
+        frames, buffer = split_frames(buffer)
+        received += frames
+    assert received == sent and buffer == b""
+
+
+def test_oversized_frames_are_rejected():
+    with pytest.raises(ValueError):
+        frame(SNAPSHOT, bytes(MAX_FRAME_SIZE + 1))
+    header = HEADER.pack(MAX_FRAME_SIZE + 1, SNAPSHOT)
+    with pytest.raises(ValueError):
+        split_frames(header)
+
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(header)
+        reader.feed_eof()
+        return await read_frame(reader)
+
+    with pytest.raises(ValueError):
+        asyncio.run(read())
+    frames, _ = split_frames(frame(SNAPSHOT, bytes(MAX_FRAME_SIZE)))
+    assert len(frames[0][1]) == MAX_FRAME_SIZE
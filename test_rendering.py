@@ -0,0 +1,61 @@
+import os
+import random
+import pytest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+from worldGenerator import PerlinNoise, ChunkStore, TILE_TYPES, TILE_COLOURS
+from Rendering import TerrainRenderer, ScrollingTerrainRenderer
+
+pygame.init()
+
+TILE = 16
+SCREEN = (200, 150)
+
+
+def reference_draw(screen, chunks, width, height, camera_x, camera_y):
+    # The original loop: one rect per visible tile
+    start_x = max(0, camera_x // TILE)
+    end_x = min(width, (camera_x + SCREEN[0]) // TILE + 1)
+    start_y = max(0, camera_y // TILE)
+    end_y = min(height, (camera_y + SCREEN[1]) // TILE + 1)
+    for y in range(start_y, end_y):
+        for x in range(start_x, end_x):
+            pygame.draw.rect(screen, TILE_COLOURS[chunks.get_tile(x, y)],
+                             (x * TILE - camera_x, y * TILE - camera_y, TILE, TILE))
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_scrolling_renderer_matches_per_tile_rects(seed):
+    # Small pans, jumps and tile edits, with a world whose edge cuts through a chunk
+    rng = random.Random(seed)
+    width, height = rng.randint(40, 70), rng.randint(30, 60)
+    chunks = ChunkStore(PerlinNoise(seed), chunk_size=8)
+    renderer = ScrollingTerrainRenderer(TerrainRenderer(chunks, width, height, TILE, max_surfaces=4))
+    max_x, max_y = width * TILE - SCREEN[0], height * TILE - SCREEN[1]
+    camera_x, camera_y = rng.randint(0, max_x), rng.randint(0, max_y)
+    screen, expected = pygame.Surface(SCREEN), pygame.Surface(SCREEN)
+    for _ in range(150):
+        roll = rng.random()
+        if roll < 0.1:
+            camera_x, camera_y = rng.randint(0, max_x), rng.randint(0, max_y)
+        elif roll < 0.7:
+            step = rng.choice([1, 5, TILE, 3 * TILE + 1])
+            camera_x = max(0, min(max_x, camera_x + rng.randint(-step, step)))
+            camera_y = max(0, min(max_y, camera_y + rng.randint(-step, step)))
+        else:
+            for _ in range(rng.randint(1, 4)):
+                # Often in the margin just outside the view, which is drawn but not on screen yet
+                x = rng.choice([camera_x // TILE - 1, (camera_x + SCREEN[0]) // TILE + 1,
+                                rng.randint(camera_x // TILE - 3, (camera_x + SCREEN[0]) // TILE + 3)])
+                y = rng.choice([camera_y // TILE - 1, (camera_y + SCREEN[1]) // TILE + 1,
+                                rng.randint(camera_y // TILE - 3, (camera_y + SCREEN[1]) // TILE + 3)])
+                if not (0 <= x < width and 0 <= y < height):
+                    continue
+                chunks.set_tile(x, y, rng.randrange(len(TILE_TYPES)))
+                renderer.tile_changed(x, y)
+        screen.fill((0, 0, 0))
+        renderer.draw(screen, camera_x, camera_y)
+        expected.fill((0, 0, 0))
+        reference_draw(expected, chunks, width, height, camera_x, camera_y)
+        assert pygame.image.tostring(screen, "RGB") == pygame.image.tostring(expected, "RGB")
@@ -0,0 +1,178 @@
+import json
+import math
+import asyncio
+import pytest
+from server import GameServer
+
+RADIUS = 500
+
+
+class RecordingClient:
+    # Stands in for server.Client and keeps the JSON packets the server sent it
+    def __init__(self, player_id):
+        self.player_id = player_id
+        self.visible = set()
+        self.snapshots = None
+        self.sent = []
+        self.closed = False
+
+    def send(self, data):
+        self.sent.append(json.loads(data))
+
+    def close(self):
+        self.closed = True
+
+    def received(self, command):
+        # {player id: data} across the packets of that command this client has been sent
+        found = {}
+        for packet in self.sent:
+            if packet["command"] == command:
+                if command == "LEAVE":
+                    found.update((player_id, None) for player_id in packet["data"])
+                else:
+                    found.update((int(player_id), data) for player_id, data in packet["data"].items())
+        return found
+
+    def take(self):
+        packets, self.sent = self.sent, []
+        return packets
+
+
+def make_server(*positions):
+    server = GameServer(world_seed=1, interest_radius=RADIUS)
+    clients = []
+    for player_id, (x, y) in enumerate(positions, 1):
+        client = RecordingClient(player_id)
+        server.join(client)
+        server.move(player_id, {"x": x, "y": y})
+        clients.append(client)
+    server.tick()
+    return server, clients
+
+
+def test_enter_and_leave_follow_the_interest_radius():
+    server, (a, b, c) = make_server((0, 0), (100, 0), (5000, 0))
+    assert a.received("ENTER") == {2: {"x": 100, "y": 0}}
+    assert b.received("ENTER") == {1: {"x": 0, "y": 0}}
+    assert c.received("ENTER") == {}
+    for client in (a, b, c):
+        client.take()
+
+    # c walks into range, b walks out of it
+    server.move(3, {"x": 200, "y": 0})
+    server.move(2, {"x": -2000, "y": 0})
+    server.tick()
+    assert a.received("ENTER") == {3: {"x": 200, "y": 0}}
+    assert a.received("LEAVE") == {2: None}
+    assert a.received("UPDATE_POS") == {}
+    assert b.received("LEAVE") == {1: None}
+    assert c.received("ENTER") == {1: {"x": 0, "y": 0}}
+    for client in (a, b, c):
+        client.take()
+
+    # A player that disconnects leaves everyone who could see it
+    server.leave(3)
+    server.tick()
+    assert a.take() == [{"command": "LEAVE", "data": [3]}]
+    assert b.take() == []
+
+
+def test_no_self_entries():
+    server, clients = make_server((0, 0), (10, 10), (20, 20))
+    for step in range(5):
+        for client in clients:
+            server.move(client.player_id, {"x": step * 7, "y": client.player_id})
+        server.tick()
+    for client in clients:
+        for command in ("ENTER", "UPDATE_POS", "LEAVE"):
+            assert client.player_id not in client.received(command)
+
+
+def test_updates_only_for_visible_players_that_moved():
+    server, (a, b, c, d) = make_server((0, 0), (100, 0), (0, 100), (5000, 0))
+    for client in (a, b, c, d):
+        client.take()
+    server.move(2, {"x": 110, "y": 0})
+    server.move(4, {"x": 5010, "y": 0})
+    server.tick()
+    assert a.take() == [{"command": "UPDATE_POS", "data": {"2": {"x": 110, "y": 0}}}]
+    assert c.take() == [{"command": "UPDATE_POS", "data": {"2": {"x": 110, "y": 0}}}]
+    assert b.take() == []
+    assert d.take() == []
+    # Nothing moved, nothing sent
+    server.tick()
+    assert a.take() == b.take() == c.take() == d.take() == []
+
+
+def test_moves_within_a_tick_coalesce():
+    # However many MOVEs arrive between ticks, each client gets one UPDATE_POS with the latest positions
+    server, (a, b, c) = make_server((0, 0), (100, 0), (0, 100))
+    for client in (a, b, c):
+        client.take()
+    for step in range(1, 21):
+        server.move(2, {"x": 100 + step, "y": 0})
+        server.move(3, {"x": 0, "y": 100 + step * 0.5})
+    server.tick()
+    assert a.take() == [{"command": "UPDATE_POS", "data": {"2": {"x": 120, "y": 0}, "3": {"x": 0, "y": 110.0}}}]
+    assert b.take() == [{"command": "UPDATE_POS", "data": {"3": {"x": 0, "y": 110.0}}}]
+    assert c.take() == [{"command": "UPDATE_POS", "data": {"2": {"x": 120, "y": 0}}}]
+
+
+@pytest.mark.parametrize("data", [None, [], [1, 2], "0,0", {}, {"x": 1}, {"x": "1", "y": 2}, {"x": None, "y": 2},
+                                  {"x": True, "y": 2}, {"x": 1, "y": False}, {"x": math.nan, "y": 0},
+                                  {"x": 0, "y": math.inf}, {"x": [1], "y": 2}])
+def test_bad_moves_are_rejected(data):
+    server, (a, b) = make_server((0, 0), (100, 0))
+    with pytest.raises(ValueError):
+        server.move(1, data)
+    assert server.players[1] == {"x": 0, "y": 0}
+    assert server.interest.positions[1] == (0, 0)
+    assert 1 not in server.moved
+
+
+class BrokenSnapshots:
+    def encode(self, view):
+        raise RuntimeError("cannot encode")
+
+
+def test_dropped_clients_are_cleaned_up():
+    # A client that sends a bad packet, or whose tick fails, is disconnected and removed from
+    # players and interest without disturbing the others
+    async def run():
+        server = GameServer(world_seed=1, interest_radius=RADIUS)
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        connections = []
+        for _ in range(3):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            assert json.loads(await reader.readline())["command"] == "SETUP"
+            connections.append((reader, writer))
+        assert set(server.players) == {1, 2, 3}
+
+        connections[0][1].write(b'{"command": "MOVE", "data": null}\n')
+        server.clients[2].snapshots = BrokenSnapshots()
+        server.tick()
+        for reader, _ in connections[:2]:
+            while await asyncio.wait_for(reader.readline(), 5):
+                pass
+        for _ in range(100):
+            if set(server.players) == {3}:
+                break
+            await asyncio.sleep(0.01)
+        assert set(server.players) == {3} and set(server.clients) == {3}
+        assert set(server.interest.positions) == {3}
+
+        # The remaining client is still served
+        connections[2][1].write(b'{"command": "MOVE", "data": {"x": 5, "y": 6}}\n')
+        await connections[2][1].drain()
+        for _ in range(100):
+            if server.players[3] == {"x": 5, "y": 6}:
+                break
+            await asyncio.sleep(0.01)
+        assert server.players[3] == {"x": 5, "y": 6}
+        for _, writer in connections:
+            writer.close()
+        listener.close()
+        await listener.wait_closed()
+
+    asyncio.run(run())
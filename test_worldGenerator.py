@@ -0,0 +1,26 @@
+import pytest
+from worldGenerator import PerlinNoise
+
+
+def reference_map(perlin, width, height, scale, offset_x=0, offset_y=0):
+    # The original per-tile loop that the array path replaced
+    if scale <= 0:
+        scale = 0.0001
+    return [[perlin.noise((x + offset_x) / scale, (y + offset_y) / scale) for x in range(width)]
+            for y in range(height)]
+
+
+@pytest.mark.parametrize("scale", [20.0, 15.0, 7.3, 1.0, 0.5, 0, -3.0])
+@pytest.mark.parametrize("seed", [1, 42, 999999])
+def test_noise_map_matches_scalar_noise(seed, scale):
+    perlin = PerlinNoise(seed)
+    assert perlin.generate_noise_map(37, 23, scale) == reference_map(perlin, 37, 23, scale)
+
+
+@pytest.mark.parametrize("offset_x, offset_y", [(0, 0), (32, 64), (-32, -96), (-1000, 31968), (250000, -7)])
+@pytest.mark.parametrize("scale", [20.0, 15.0, 0.5, 0])
+@pytest.mark.parametrize("seed", [1, 42])
+def test_noise_array_matches_scalar_noise(seed, scale, offset_x, offset_y):
+    perlin = PerlinNoise(seed)
+    values = perlin.generate_noise_array(32, 32, scale, offset_x, offset_y)
+    assert values.tolist() == reference_map(perlin, 32, 32, scale, offset_x, offset_y)
@@ -1,8 +1,40 @@
 import pygame
 import math
 import random
+import threading
+import numpy as np
+from collections import OrderedDict
 from typing import List, Tuple
 
+CHUNK_SIZE = 32
+MAX_CHUNKS = 2048
+
+
+class TileType:
+    def __init__(self, name: str, colour: Tuple[int, int, int], passable: bool = True, casts_shadow: bool = False):
+        self.name = name
+        self.colour = colour
+        self.passable = passable
+        self.casts_shadow = casts_shadow
+
+
+# Tiles are stored as their index in this registry (one byte per tile)
+TILE_TYPES = [
+    TileType('water', (173, 216, 230)),
+    TileType('sand', (238, 203, 173)),
+    TileType('grass', (0, 255, 0)),
+    TileType('forest', (0, 150, 0), casts_shadow=True),
+    TileType('dirt', (139, 69, 19)),
+    TileType('mountain', (128, 128, 128), passable=False, casts_shadow=True),
+]
+WATER, SAND, GRASS, FOREST, DIRT, MOUNTAIN = range(len(TILE_TYPES))
+TILE_IDS = {tile.name: tile_id for tile_id, tile in enumerate(TILE_TYPES)}
+
+# Per-attribute lookup tables, indexed by tile id
+TILE_COLOURS = [tile.colour for tile in TILE_TYPES]
+TILE_PASSABLE = bytes(tile.passable for tile in TILE_TYPES)
+TILE_CASTS_SHADOW = bytes(tile.casts_shadow for tile in TILE_TYPES)
+
 
 class Tiles:
     def __init__(self, size, colour):
@@ -31,6 +63,10 @@ class PerlinNoise:
             (0, 1),
             (0, -1)
         ]
+        # Array copies of the tables above for the batched noise path
+        self.perm_array = np.array(self.perm, dtype=np.int64)
+        self.gradient_x = np.array([g[0] for g in self.gradients], dtype=np.int64)
+        self.gradient_y = np.array([g[1] for g in self.gradients], dtype=np.int64)
 
     def _fade(self, t: float) -> float:
         return t * t * t * (t * (t * 6 - 15) + 10)
@@ -72,22 +108,109 @@ class PerlinNoise:
 
         return (result + 1) * 0.5
 
-    def generate_noise_map(self, width: int, height: int, scale: float = 1.0) -> List[List[float]]:
-        if scale <= 0:
-            scale = 0.0001
+    def _get_gradient_array(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        hash_val = self.perm_array[(self.perm_array[x % 256] + y) % 256] % 8
+        return self.gradient_x[hash_val], self.gradient_y[hash_val]
+
+    def noise_array(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        # Same steps as noise(), applied element-wise so every value matches it exactly
+        x0 = np.floor(x).astype(np.int64)
+        y0 = np.floor(y).astype(np.int64)
+        x1 = x0 + 1
+        y1 = y0 + 1
+
+        sx = x - x0
+        sy = y - y0
+
+        u = self._fade(sx)
+        v = self._fade(sy)
+
+        g00x, g00y = self._get_gradient_array(x0, y0)
+        g10x, g10y = self._get_gradient_array(x1, y0)
+        g01x, g01y = self._get_gradient_array(x0, y1)
+        g11x, g11y = self._get_gradient_array(x1, y1)
+
+        n00 = g00x * sx + g00y * sy
+        n10 = g10x * (sx - 1) + g10y * sy
+        n01 = g01x * sx + g01y * (sy - 1)
+        n11 = g11x * (sx - 1) + g11y * (sy - 1)
+        nx0 = self._lerp(n00, n10, u)
+        nx1 = self._lerp(n01, n11, u)
+        result = self._lerp(nx0, nx1, v)
 
-        noise_map = [[0 for _ in range(width)] for _ in range(height)]
+        return (result + 1) * 0.5
 
-        for y in range(height):
-            for x in range(width):
-                sample_x = x / scale
-                sample_y = y / scale
+    def generate_noise_array(self, width: int, height: int, scale: float = 1.0,
+                             offset_x: int = 0, offset_y: int = 0) -> np.ndarray:
+        if scale <= 0:
+            scale = 0.0001
 
-                noise_value = self.noise(sample_x, sample_y)
+        sample_x = (np.arange(width, dtype=np.float64) + offset_x) / scale
+        sample_y = (np.arange(height, dtype=np.float64) + offset_y) / scale
 
-                noise_map[y][x] = noise_value
+        return self.noise_array(sample_x[np.newaxis, :], sample_y[:, np.newaxis])
 
-        return noise_map
+    def generate_noise_map(self, width: int, height: int, scale: float = 1.0) -> List[List[float]]:
+        return self.generate_noise_array(width, height, scale).tolist()
+
+
+def classify_terrain(elevation_map: np.ndarray, moisture_map: np.ndarray) -> np.ndarray:
+    land = elevation_map < 0.7
+    return np.select(
+        [elevation_map < 0.3,
+         elevation_map < 0.4,
+         land & (moisture_map > 0.6),
+         land & (moisture_map > 0.3),
+         land],
+        [WATER, SAND, FOREST, GRASS, DIRT],
+        default=MOUNTAIN
+    ).astype(np.uint8)
+
+
+class ChunkStore:
+    def __init__(self, perlin: PerlinNoise, chunk_size: int = CHUNK_SIZE, max_chunks: int = MAX_CHUNKS):
+        self.perlin = perlin
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.chunks = OrderedDict()  # (chunk_x, chunk_y) -> bytearray of tile ids (row-major), least recently used first
+        self.edits = {}  # (chunk_x, chunk_y) -> {index in chunk: tile}, reapplied after eviction
+        self.lock = threading.RLock()  # Path searches read tiles from a worker thread
+
+    def generate_chunk(self, chunk_x: int, chunk_y: int) -> bytearray:
+        size = self.chunk_size
+        origin_x = chunk_x * size
+        origin_y = chunk_y * size
+        elevation_map = self.perlin.generate_noise_array(size, size, 20.0, origin_x, origin_y)
+        moisture_map = self.perlin.generate_noise_array(size, size, 15.0, origin_x, origin_y)
+        chunk = bytearray(classify_terrain(elevation_map, moisture_map).tobytes())
+        for index, tile in self.edits.get((chunk_x, chunk_y), {}).items():
+            chunk[index] = tile
+        return chunk
+
+    def get_chunk(self, chunk_x: int, chunk_y: int) -> bytearray:
+        key = (chunk_x, chunk_y)
+        with self.lock:
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                chunk = self.generate_chunk(chunk_x, chunk_y)
+                self.chunks[key] = chunk
+                if len(self.chunks) > self.max_chunks:
+                    self.chunks.popitem(last=False)
+            else:
+                self.chunks.move_to_end(key)
+            return chunk
+
+    def get_tile(self, x: int, y: int) -> int:
+        size = self.chunk_size
+        return self.get_chunk(x // size, y // size)[(y % size) * size + x % size]
+
+    def set_tile(self, x: int, y: int, tile: int):
+        size = self.chunk_size
+        key = (x // size, y // size)
+        index = (y % size) * size + x % size
+        with self.lock:
+            self.edits.setdefault(key, {})[index] = tile
+            self.get_chunk(*key)[index] = tile
 
 
 if __name__ == "__main__":